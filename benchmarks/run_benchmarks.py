@@ -0,0 +1,388 @@
+"""
+Offline benchmarks of the pipeline stages, run against synthetic sources and a
+local database:
+
+    python -m benchmarks.run_benchmarks --entities 20 --years 2 --output new.json
+    python -m benchmarks.run_benchmarks --output new.json --compare old.json
+
+Saves with a query budget are also run with the given number of entities and
+four times as many, and fail the run if they execute more statements than
+their budget.
+"""
+
+import argparse
+from datetime import datetime
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from time import perf_counter
+
+import pandas as pd
+
+from benchmarks.synthetic import (
+    END_DATE,
+    FrameTransformer,
+    SyntheticCoinList,
+    SyntheticCoinPriceHistory,
+    SyntheticStockInfo,
+    SyntheticStockPrice,
+    SyntheticTopStocksScraper,
+    SyntheticYahooStockPriceHistory,
+)
+from src.data_targets.engines import (
+    QueryBudgetExceeded,
+    dispose_engines,
+    query_budget,
+)
+from src.data_targets.targets import DBCoinTarget, DBPredictionTarget, DBStockTarget
+from src.ml.model import Model
+from src.transformations.transformations import (
+    CoinrankingToDailyStockData,
+    CoinTrainingData,
+    DailyStockData,
+    Date,
+    ModelTrainingData,
+    PredictionsData,
+    StockTrainingData,
+    Time,
+    Transformer,
+)
+
+# Statements a save may execute whatever the number of rows. The row by row
+# paths are left out, they execute statements per row by design.
+QUERY_BUDGETS = {
+    "coin_daily_save_bulk": 12,
+    "stock_daily_save_bulk": 12,
+    "coin_daily_save_bulk_smart_keys": 10,
+    "stock_daily_save_bulk_smart_keys": 10,
+    "prediction_save_atomic": 4,
+    "prediction_save_changed": 10,
+}
+
+
+class BenchmarkRunner:
+    def __init__(
+        self,
+        entities: int,
+        years: int,
+        repeat: int = 3,
+        connection_string: str = None,
+        profile_memory: bool = True,
+    ) -> None:
+        self.entities = entities
+        self.years = years
+        self.repeat = repeat
+        self.connection_string = connection_string
+        self.profile_memory = profile_memory
+        self.database_directory = tempfile.mkdtemp(prefix="benchmarks_")
+        self.results = {}
+        self.query_budgets = {}
+
+    def get_connection_string(self, stage: str, run: int) -> str:
+        if self.connection_string:
+            return self.connection_string
+        database_path = os.path.join(self.database_directory, f"{stage}_{run}.db")
+        return f"sqlite:///{database_path}"
+
+    def measure(self, stage: str, function, setup=None):
+        """
+        Times every run of the stage and keeps the fastest one. Peak memory is
+        measured with tracemalloc in an extra run, so it does not slow down
+        the timed runs. setup runs before every run and is not measured.
+        """
+        timings = []
+        runs = self.repeat + (1 if self.profile_memory else 0)
+        for run in range(runs):
+            arguments = (setup(run),) if setup else ()
+            is_memory_run = self.profile_memory and run == self.repeat
+            if is_memory_run:
+                tracemalloc.start()
+            start = perf_counter()
+            result = function(*arguments)
+            elapsed = perf_counter() - start
+            if is_memory_run:
+                peak_memory = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            else:
+                timings.append(elapsed)
+
+        self.results[stage] = {
+            "seconds": min(timings),
+            "seconds_all": timings,
+            "peak_memory_mb": (
+                round(peak_memory / 2**20, 3) if self.profile_memory else None
+            ),
+            "rows": len(result) if isinstance(result, pd.DataFrame) else None,
+        }
+        print(
+            f"{stage:<32} {self.results[stage]['seconds']:>9.4f}s "
+            f"{self.results[stage]['peak_memory_mb'] or 0:>9.1f} MB"
+        )
+        return result
+
+    def check_query_budget(self, stage: str, make_transformer, make_target):
+        """
+        Saves the transformer of entities and of four times as many entities
+        within the query budget of the stage, if it has one. make_target gets
+        the number of entities, so every save uses its own database.
+        """
+        budget = QUERY_BUDGETS.get(stage)
+        if budget is None:
+            return
+
+        statements = {}
+        exceeded = []
+        for entities in (self.entities, 4 * self.entities):
+            target = make_target(entities)
+            transformer = make_transformer(entities)
+            try:
+                with query_budget(budget, f"{stage} of {entities} entities"):
+                    target.save(transformer)
+            except QueryBudgetExceeded as e:
+                exceeded.append(str(e))
+            statements[entities] = target.last_save_statements
+
+        self.query_budgets[stage] = {
+            "budget": budget,
+            "statements": statements,
+            "passed": not exceeded,
+        }
+        print(
+            f"{stage + ' statements':<32} {statements} budget {budget}"
+            + "".join(f"\n  {message}" for message in exceeded)
+        )
+
+    def run(self) -> dict:
+        try:
+            return self.run_stages()
+        finally:
+            dispose_engines()
+            shutil.rmtree(self.database_directory, ignore_errors=True)
+
+    def run_stages(self) -> dict:
+        n = self.entities
+        model = Model(14, early_stopping_rounds=50, num_boost_round=1000)
+
+        self.measure(
+            "top_stocks_scrape", lambda: SyntheticTopStocksScraper(n).get_data()
+        )
+
+        datetimes = pd.DataFrame(
+            {
+                "datetime": pd.date_range(
+                    end=END_DATE, periods=n * 365 * self.years, freq="h"
+                )
+            }
+        )
+        self.measure(
+            "date_time_merge",
+            lambda: Date().merge_with_date(Time().merge_with_time(datetimes.copy())),
+        )
+
+        def coin_transformer(entities: int) -> Transformer:
+            return CoinrankingToDailyStockData(SyntheticCoinList(entities), entities)
+
+        def stock_transformer(entities: int) -> Transformer:
+            return DailyStockData(
+                SyntheticTopStocksScraper(entities),
+                SyntheticStockInfo(),
+                SyntheticStockPrice(),
+                entities,
+            )
+
+        for bulk_load, smart_dimension_keys in (
+            (False, False),
+            (True, False),
+            (False, True),
+            (True, True),
+        ):
+            suffix = ("bulk" if bulk_load else "rows") + (
+                "_smart_keys" if smart_dimension_keys else ""
+            )
+            target_options = {
+                "max_retries": 1,
+                "bulk_load": bulk_load,
+                "smart_dimension_keys": smart_dimension_keys,
+            }
+            for name, target_class, make_transformer in (
+                ("coin", DBCoinTarget, coin_transformer),
+                ("stock", DBStockTarget, stock_transformer),
+            ):
+                self.measure(
+                    f"{name}_daily_save_{suffix}",
+                    lambda target: target.save(make_transformer(n)),
+                    setup=lambda run: target_class(
+                        self.get_connection_string(f"{name}_{suffix}", run),
+                        **target_options,
+                    ),
+                )
+                self.check_query_budget(
+                    f"{name}_daily_save_{suffix}",
+                    make_transformer,
+                    lambda entities: target_class(
+                        self.get_connection_string(f"{name}_{suffix}_budget", entities),
+                        **target_options,
+                    ),
+                )
+
+        training_data_transformer = ModelTrainingData(
+            StockTrainingData(
+                SyntheticTopStocksScraper(n),
+                SyntheticYahooStockPriceHistory(),
+                self.years,
+                n,
+            ),
+            CoinTrainingData(
+                SyntheticCoinList(n),
+                SyntheticCoinPriceHistory(self.years),
+                self.years,
+                n,
+            ),
+        )
+        training_df = self.measure("training_data", training_data_transformer.transform)
+
+        entity = training_df["entity"].iloc[0]
+        entity_df = training_df[training_df["entity"] == entity].drop(columns="entity")
+        self.measure("model_lightgbm", lambda: model.lightgbm(entity_df.copy()))
+
+        predictions = self.measure(
+            "predictions_transform",
+            PredictionsData(FrameTransformer(training_df), model).transform,
+        )
+
+        for replace_mode in DBPredictionTarget.REPLACE_MODES[1:]:
+            self.measure(
+                f"prediction_save_{replace_mode}",
+                lambda target: target.save(FrameTransformer(predictions)),
+                setup=lambda run: DBPredictionTarget(
+                    self.get_connection_string(f"prediction_{replace_mode}", run),
+                    max_retries=1,
+                    replace_mode=replace_mode,
+                ),
+            )
+            self.check_query_budget(
+                f"prediction_save_{replace_mode}",
+                lambda entities: FrameTransformer(
+                    pd.concat(
+                        predictions.assign(
+                            entity=predictions["entity"].astype(str) + f"_{copy}"
+                        )
+                        for copy in range(entities // n)
+                    )
+                ),
+                lambda entities: DBPredictionTarget(
+                    self.get_connection_string(
+                        f"prediction_{replace_mode}_budget", entities
+                    ),
+                    max_retries=1,
+                    replace_mode=replace_mode,
+                ),
+            )
+
+        return {
+            "metadata": self.get_metadata(),
+            "stages": self.results,
+            "query_budgets": self.query_budgets,
+        }
+
+    def get_metadata(self) -> dict:
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+
+        return {
+            "commit": commit,
+            "created_at": datetime.now().isoformat(),
+            "entities": self.entities,
+            "years": self.years,
+            "repeat": self.repeat,
+            "database": (
+                self.connection_string.split(":", 1)[0]
+                if self.connection_string
+                else "sqlite"
+            ),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+        }
+
+
+def compare(baseline: dict, current: dict, max_slowdown: float = None) -> bool:
+    """
+    Prints the time and memory ratio of every stage to the baseline and
+    returns False if a stage got slower than max_slowdown times the baseline.
+    """
+    print(
+        f"{'stage':<32} {'baseline s':>11} {'current s':>10} {'ratio':>6} "
+        f"{'baseline MB':>12} {'current MB':>11}"
+    )
+    is_within_limits = True
+    for stage, result in current["stages"].items():
+        baseline_result = baseline["stages"].get(stage)
+        if baseline_result is None:
+            print(f"{stage:<32} {'-':>11} {result['seconds']:>10.4f}")
+            continue
+
+        ratio = result["seconds"] / max(baseline_result["seconds"], 1e-9)
+        if max_slowdown and ratio > max_slowdown:
+            is_within_limits = False
+        print(
+            f"{stage:<32} {baseline_result['seconds']:>11.4f} "
+            f"{result['seconds']:>10.4f} {ratio:>6.2f} "
+            f"{baseline_result['peak_memory_mb'] or 0:>12.1f} "
+            f"{result['peak_memory_mb'] or 0:>11.1f}"
+        )
+    return is_within_limits
+
+
+def main(arguments=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entities", type=int, default=10)
+    parser.add_argument("--years", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--connection-string",
+        help="Database to benchmark against, a new SQLite file per run by default",
+    )
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="Results file of an earlier run")
+    parser.add_argument("--max-slowdown", type=float)
+    arguments = parser.parse_args(arguments)
+
+    logging.basicConfig(level=logging.WARNING)
+
+    results = BenchmarkRunner(
+        arguments.entities,
+        arguments.years,
+        arguments.repeat,
+        arguments.connection_string,
+        not arguments.no_memory,
+    ).run()
+    with open(arguments.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    if not all(result["passed"] for result in results["query_budgets"].values()):
+        return 1
+
+    if arguments.compare:
+        with open(arguments.compare) as f:
+            baseline = json.load(f)
+        if not compare(baseline, results, arguments.max_slowdown):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import requests
+
+from src.data_sources.sources import (
+    APISource,
+    CoinrankingCoinPriceHistory,
+    FinancialModellingPrepStockDataInfo,
+    FinnhubStockPrice,
+    UrlWebScraper,
+    YahooStockPriceHistory,
+)
+from src.transformations.transformations import Date, Time, Transformer
+
+# Fixed "today" of the synthetic data, outside of ISO week 53 so the dates
+# pass the week check of dim_date_t.
+END_DATE = datetime(2024, 6, 14, 16, 0)
+SEED = 42
+
+
+def coin_uuid(index: int) -> str:
+    return f"synthetic-coin-{index:05d}"
+
+
+def stock_symbol(index: int) -> str:
+    return f"SYN{index:05d}"
+
+
+def random_walk(entity_index: int, periods: int, start_price: float) -> np.ndarray:
+    rng = np.random.default_rng(SEED + entity_index)
+    returns = rng.normal(0.0005, 0.02, periods)
+    return start_price * np.exp(np.cumsum(returns))
+
+
+class FrameTransformer(Transformer):
+    """
+    Transforms to a fixed frame, and to its rows of the given entities when
+    saved in chunks or downloaded since a date. Raises for the entities in
+    fail_on, as a failing source would.
+    """
+
+    def __init__(self, data: pd.DataFrame, entity_column: str = "entity") -> None:
+        super().__init__()
+        self.data = data
+        self.entity_column = entity_column
+        self.fail_on = set()
+        self.transformed_entities = []
+        self.transformed_since = {}
+
+    def transform(self) -> pd.DataFrame:
+        return self.data.copy()
+
+    def get_entities(self) -> list:
+        return list(self.data[self.entity_column].unique())
+
+    def transform_entities(self, entities: list, since: date = None) -> pd.DataFrame:
+        if self.fail_on.intersection(entities):
+            raise RuntimeError(f"Source failed for {entities}")
+        self.transformed_entities.extend(entities)
+        self.transformed_since.update(dict.fromkeys(entities, since))
+        data = self.data[self.data[self.entity_column].isin(entities)]
+        if since is not None:
+            data = data[data["datetime"] >= pd.Timestamp(since)]
+        return data.copy()
+
+
+def coin_rows(datetimes: list, num_of_coins: int = 3) -> pd.DataFrame:
+    """
+    Daily coin rows of DBCoinTarget for every coin at every datetime.
+    """
+    data = pd.DataFrame(
+        [
+            {
+                "datetime": pd.Timestamp(value),
+                "uuid": coin_uuid(index),
+                "name": f"Coin {index}",
+                "symbol": f"C{index}",
+                "icon_url": f"https://coins.invalid/{index}.svg",
+                "price": 100.0 + index,
+                "change": 0.1,
+                "rank": index + 1,
+            }
+            for value in datetimes
+            for index in range(num_of_coins)
+        ]
+    )
+    data = Date().merge_with_date(Time().merge_with_time(data))
+    return data.drop(columns="datetime")
+
+
+class SyntheticCoinList(APISource):
+    """
+    Stands in for the coinranking coin list, used both for the daily coin data
+    and for the coin uuids of the training data.
+    """
+
+    def __init__(self, num_of_coins: int) -> None:
+        super().__init__("https://synthetic.invalid/coins")
+        self.num_of_coins = num_of_coins
+
+    def get_data(self, url=None, params=None) -> dict:
+        coins = [
+            {
+                "uuid": coin_uuid(index),
+                "symbol": f"C{index}",
+                "name": f"Synthetic Coin {index}",
+                "iconUrl": f"https://synthetic.invalid/coins/{index}.svg",
+                "price": f"{random_walk(index, 1, 100 + index)[0]:.8f}",
+                "change": f"{(index % 21 - 10) / 10:.2f}",
+                "rank": index + 1,
+            }
+            for index in range(self.num_of_coins)
+        ]
+        return {"data": {"coins": coins}}
+
+
+class SyntheticCoinPriceHistory(CoinrankingCoinPriceHistory):
+    def __init__(self, past_num_of_years: int) -> None:
+        super().__init__("https://synthetic.invalid/coin/<uuid>/history")
+        self.past_num_of_years = past_num_of_years
+
+    def get_data(self, uuid: str, since: date = None) -> dict:
+        index = int(uuid.rsplit("-", 1)[1])
+        dates = pd.date_range(
+            end=END_DATE, periods=365 * self.past_num_of_years, freq="D"
+        )
+        prices = random_walk(index, len(dates), 100 + index)
+        if since is not None:
+            is_since = dates >= pd.Timestamp(since)
+            dates, prices = dates[is_since], prices[is_since]
+        history = [
+            {"timestamp": int(date.timestamp()), "price": f"{price:.8f}"}
+            for date, price in zip(dates[::-1], prices[::-1])
+        ]
+        return {"data": {"history": history}}
+
+
+class SyntheticTopStocksScraper(UrlWebScraper):
+    """
+    Serves a generated top-stocks page, so the real table parsing runs without
+    a request.
+    """
+
+    def __init__(self, num_of_stocks: int) -> None:
+        super().__init__("https://synthetic.invalid/list/biggest-companies/")
+        self.num_of_stocks = num_of_stocks
+
+    def _fetch(self, metadata=None) -> requests.Response:
+        rows = "".join(
+            f"<tr><td>{index + 1}</td><td>{stock_symbol(index)}</td>"
+            f"<td>Synthetic Company {index}, Inc.</td>"
+            f"<td>{3500 - index * 0.5:,.2f}B</td><td>{100 + index:.2f}</td>"
+            f"<td>{(index % 21 - 10) / 10:.2f}%</td>"
+            f"<td>{'-' if index % 13 == 0 else f'{120 + index:.2f}B'}</td></tr>"
+            for index in range(self.num_of_stocks)
+        )
+        response = requests.Response()
+        response.status_code = 200
+        response._content = (
+            "<html><body><table><thead><tr><th>No.</th><th>Symbol</th>"
+            "<th>Company Name</th><th>Market Cap</th><th>Stock Price</th>"
+            "<th>% Change</th><th>Revenue</th></tr></thead>"
+            f"<tbody>{rows}</tbody></table></body></html>"
+        ).encode()
+        return response
+
+
+class SyntheticStockInfo(FinancialModellingPrepStockDataInfo):
+    def __init__(self) -> None:
+        super().__init__("https://synthetic.invalid/profile/<symbol>")
+
+    def get_data(self, symbol: str) -> dict:
+        return {
+            "symbol": symbol,
+            "companyName": f"Synthetic Company {symbol}",
+            "exchangeShortName": "NASDAQ",
+            "image": f"https://synthetic.invalid/logos/{symbol}.png",
+            "industry": "Software",
+        }
+
+
+class SyntheticStockPrice(FinnhubStockPrice):
+    def __init__(self) -> None:
+        super().__init__("https://synthetic.invalid/quote?symbol=<symbol>")
+
+    def get_data(self, symbol: str) -> dict:
+        index = int(symbol[3:])
+        close = random_walk(index, 1, 100 + index)[0]
+        return {
+            "t": int(END_DATE.timestamp()),
+            "c": round(close, 2),
+            "h": round(close * 1.01, 2),
+            "l": round(close * 0.99, 2),
+            "o": round(close * 1.002, 2),
+        }
+
+
+class SyntheticYahooStockPriceHistory(YahooStockPriceHistory):
+    def get_data(
+        self, symbols: list, past_num_of_years: int, since: date = None
+    ) -> pd.DataFrame:
+        dates = pd.bdate_range(
+            end=END_DATE.date(),
+            periods=252 * past_num_of_years,
+            tz="America/New_York",
+            name="Date",
+        )
+        is_since = slice(None)
+        if since is not None:
+            is_since = dates.tz_localize(None) >= pd.Timestamp(since)
+        histories = []
+        for symbol in symbols:
+            close = random_walk(int(symbol[3:]), len(dates), 100)[is_since]
+            histories.append(
+                pd.DataFrame(
+                    {
+                        "Open": close * 1.002,
+                        "High": close * 1.01,
+                        "Low": close * 0.99,
+                        "Close": close,
+                        "Volume": 1_000_000,
+                        "symbol": symbol,
+                    },
+                    index=dates[is_since],
+                )
+            )
+        return pd.concat(histories) if histories else pd.DataFrame()
@@ -1,6 +1,8 @@
 import logging
 import azure.functions as func
-from src.pipelines import ml_price_prediction
+from src.config import load_config
+from src.instrumentation import configure_instrumentation, invocation
+from src.startup import get_startup_report, import_timed
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +23,11 @@ def etl_lightgbm_predict_insert(myTimer: func.TimerRequest) -> None:
         logging.info("The timer is past due!")
 
     try:
-        ml_price_prediction.run()
+        ml_price_prediction = import_timed("src.pipelines.ml_price_prediction")
+        logger.info(f"Startup report: {get_startup_report()}")
+        configure_instrumentation(**load_config().instrumentation)
+        with invocation("ml_price_prediction"):
+            ml_price_prediction.run()
         logger.info("Daily coin data retrieved successfully.")
     except Exception as e:
         logger.error(
@@ -1,6 +1,8 @@
 import logging
 import azure.functions as func
-from src.pipelines import daily_coin_data
+from src.config import load_config
+from src.instrumentation import configure_instrumentation, invocation
+from src.startup import get_startup_report, import_timed
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +23,11 @@ def timer_trigger_get_daily_coin_data(myTimer: func.TimerRequest) -> None:
         logger.warning("The timer is past due!")
 
     try:
-        daily_coin_data.run()
+        daily_coin_data = import_timed("src.pipelines.daily_coin_data")
+        logger.info(f"Startup report: {get_startup_report()}")
+        configure_instrumentation(**load_config().instrumentation)
+        with invocation("daily_coin_data"):
+            daily_coin_data.run()
         logger.info("Daily coin data retrieved successfully.")
     except Exception as e:
         logger.error(
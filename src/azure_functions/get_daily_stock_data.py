@@ -1,6 +1,8 @@
 import logging
 import azure.functions as func
-from src.pipelines import daily_stock_data
+from src.config import load_config
+from src.instrumentation import configure_instrumentation, invocation
+from src.startup import get_startup_report, import_timed
 
 logger = logging.getLogger(__name__)
 
@@ -24,7 +26,11 @@ def timer_trigger_get_daily_stock_data(myTimer: func.TimerRequest) -> None:
         logger.warning("The timer is past due!")
 
     try:
-        daily_stock_data.run()
+        daily_stock_data = import_timed("src.pipelines.daily_stock_data")
+        logger.info(f"Startup report: {get_startup_report()}")
+        configure_instrumentation(**load_config().instrumentation)
+        with invocation("daily_stock_data"):
+            daily_stock_data.run()
         logger.info("Daily stock data retrieved successfully.")
     except Exception as e:
         logger.error(
@@ -0,0 +1,100 @@
+from functools import lru_cache
+import os
+import tempfile
+
+import yaml
+
+CONFIG_PATH = "database_config.yaml"
+
+REQUIRED_KEYS = (
+    ("data_targets", "databases", "remote", "azure_sql_server", "connection_string"),
+    ("data_sources", "api_data_sources", "coinranking_daily_coin_data"),
+    ("data_sources", "api_data_sources", "coinranking_coin_uuid"),
+    ("data_sources", "api_data_sources", "coinranking_coin_price_history"),
+    ("data_sources", "api_data_sources", "financial_modeling_prep_stock_info"),
+    ("data_sources", "api_data_sources", "finnhub_stock_price"),
+    ("data_sources", "web_scraping_sources", "stock_analysis_top_stocks"),
+    ("pipelines", "general", "max_retry_count_on_fail"),
+    ("pipelines", "ml_price_prediction"),
+)
+
+
+class Config:
+    def __init__(self, yaml_dictionary: dict) -> None:
+        self.yaml_dictionary = yaml_dictionary
+        self.validate()
+
+    def validate(self):
+        missing_keys = [
+            ".".join(keys) for keys in REQUIRED_KEYS if self._get(*keys) is None
+        ]
+        if missing_keys:
+            raise ValueError(f"Missing configuration keys: {', '.join(missing_keys)}")
+
+    def _get(self, *keys, default=None):
+        value = self.yaml_dictionary
+        for key in keys:
+            if not isinstance(value, dict) or value.get(key) is None:
+                return default
+            value = value[key]
+        return value
+
+    @property
+    def connection_string(self) -> str:
+        return self._get(
+            "data_targets",
+            "databases",
+            "remote",
+            "azure_sql_server",
+            "connection_string",
+        )
+
+    @property
+    def engine(self) -> dict:
+        return self._get("data_targets", "engine", default={})
+
+    @property
+    def http(self) -> dict:
+        return self._get("data_sources", "http", default={})
+
+    @property
+    def price_history_cache(self) -> dict:
+        return self._get("data_sources", "price_history_cache", default={})
+
+    @property
+    def web_table_cache(self) -> dict:
+        return self._get("data_sources", "web_table_cache", default={})
+
+    @property
+    def instrumentation(self) -> dict:
+        return self._get("instrumentation", default={})
+
+    @property
+    def general(self) -> dict:
+        return self._get("pipelines", "general", default={})
+
+    def api_source(self, name: str) -> dict:
+        return self._get("data_sources", "api_data_sources", name)
+
+    def web_scraping_source(self, name: str) -> dict:
+        return self._get("data_sources", "web_scraping_sources", name)
+
+    def pipeline(self, name: str) -> dict:
+        return self._get("pipelines", name, default={})
+
+
+def get_local_path(path: str) -> str:
+    """
+    Resolves relative paths of local caches and stores against the temporary
+    directory, as the package directory is read-only on Azure Functions.
+    """
+    path = os.path.expanduser(os.path.expandvars(path))
+    if os.path.isabs(path):
+        return path
+    return os.path.join(tempfile.gettempdir(), path)
+
+
+@lru_cache(maxsize=None)
+def load_config(path: str = CONFIG_PATH) -> Config:
+    with open(path) as f:
+        return Config(yaml.safe_load(f))
@@ -0,0 +1,210 @@
+from datetime import datetime, timedelta
+import json
+import logging
+import os
+import re
+import sys
+from threading import Lock
+from typing import Optional
+
+import pandas as pd
+
+from src.config import get_local_path
+
+
+class PriceHistoryCache:
+    def __init__(self, path: str, ttl_days: int = 30) -> None:
+        self.path = path
+        self.ttl_days = ttl_days
+
+    def _get_paths(self, namespace: str, entity: str) -> tuple:
+        file_name = re.sub(r"[^\w.-]", "_", str(entity))
+        directory = os.path.join(self.path, namespace)
+        return (
+            os.path.join(directory, f"{file_name}.parquet"),
+            os.path.join(directory, f"{file_name}.json"),
+        )
+
+    def get_metadata(self, namespace: str, entity: str) -> Optional[dict]:
+        _, metadata_path = self._get_paths(namespace, entity)
+        if not os.path.exists(metadata_path):
+            return None
+
+        with open(metadata_path) as f:
+            return json.load(f)
+
+    def is_expired(self, metadata: dict) -> bool:
+        created_at = datetime.fromisoformat(metadata["created_at"])
+        return datetime.now() - created_at > timedelta(days=self.ttl_days)
+
+    def read(self, namespace: str, entity: str) -> tuple:
+        """
+        Returns the cached history and its metadata, or (None, None) when the
+        entity is not cached or its entry is older than the TTL.
+        """
+        metadata = self.get_metadata(namespace, entity)
+        data_path, _ = self._get_paths(namespace, entity)
+        if metadata is None or not os.path.exists(data_path):
+            return None, None
+        if self.is_expired(metadata):
+            self.invalidate(namespace, entity)
+            return None, None
+
+        return pd.read_parquet(data_path), metadata
+
+    def write(
+        self,
+        namespace: str,
+        entity: str,
+        data: pd.DataFrame,
+        watermark: datetime,
+        metadata: Optional[dict] = None,
+    ):
+        data_path, metadata_path = self._get_paths(namespace, entity)
+        now = datetime.now().isoformat()
+        metadata = {
+            "created_at": now,
+            **(metadata or {}),
+            "updated_at": now,
+            "watermark": pd.Timestamp(watermark).isoformat(),
+            "rows": len(data),
+        }
+        try:
+            os.makedirs(os.path.dirname(data_path), exist_ok=True)
+            data.to_parquet(data_path)
+            with open(metadata_path, "w") as f:
+                json.dump(metadata, f)
+        except OSError as e:
+            logging.warning(f"Failed to write the price history cache of {entity}: {e}")
+
+    def invalidate(self, namespace: Optional[str] = None, entity: Optional[str] = None):
+        for entry_namespace, entry_entity in self.list_entries():
+            if namespace not in (None, entry_namespace):
+                continue
+            if entity not in (None, entry_entity):
+                continue
+            for path in self._get_paths(entry_namespace, entry_entity):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def list_entries(self) -> list:
+        if not os.path.isdir(self.path):
+            return []
+
+        entries = []
+        for namespace in sorted(os.listdir(self.path)):
+            directory = os.path.join(self.path, namespace)
+            if not os.path.isdir(directory):
+                continue
+            for file_name in sorted(os.listdir(directory)):
+                if file_name.endswith(".json"):
+                    entries.append((namespace, file_name[: -len(".json")]))
+        return entries
+
+    def info(self) -> pd.DataFrame:
+        rows = []
+        for namespace, entity in self.list_entries():
+            metadata = self.get_metadata(namespace, entity)
+            data_path, _ = self._get_paths(namespace, entity)
+            rows.append(
+                {
+                    "namespace": namespace,
+                    "entity": entity,
+                    **metadata,
+                    "expired": self.is_expired(metadata),
+                    "size_bytes": (
+                        os.path.getsize(data_path) if os.path.exists(data_path) else 0
+                    ),
+                }
+            )
+        return pd.DataFrame(rows)
+
+
+# Tables read by any WebTableCache of this process, by url.
+_web_tables = {}
+_web_tables_lock = Lock()
+
+
+class WebTableCache:
+    """
+    Keeps scraped tables in memory and on disk together with the validators
+    of the response they were parsed from. Entries older than the TTL are
+    still returned, so they can be revalidated with a conditional request.
+    """
+
+    NAMESPACE = "web_tables"
+
+    def __init__(self, path: str, ttl_hours: float = 12) -> None:
+        self.path = path
+        self.ttl_hours = ttl_hours
+
+    def _get_paths(self, url: str) -> tuple:
+        file_name = re.sub(r"[^\w.-]", "_", url)
+        directory = os.path.join(self.path, self.NAMESPACE)
+        return (
+            os.path.join(directory, f"{file_name}.parquet"),
+            os.path.join(directory, f"{file_name}.json"),
+        )
+
+    def is_fresh(self, metadata: dict) -> bool:
+        fetched_at = datetime.fromisoformat(metadata["fetched_at"])
+        return datetime.now() - fetched_at <= timedelta(hours=self.ttl_hours)
+
+    def get(self, url: str) -> tuple:
+        with _web_tables_lock:
+            if url in _web_tables:
+                return _web_tables[url]
+
+        data_path, metadata_path = self._get_paths(url)
+        if not (os.path.exists(data_path) and os.path.exists(metadata_path)):
+            return None, None
+
+        with open(metadata_path) as f:
+            metadata = json.load(f)
+        entry = (pd.read_parquet(data_path), metadata)
+        with _web_tables_lock:
+            _web_tables[url] = entry
+        return entry
+
+    def put(
+        self,
+        url: str,
+        data: pd.DataFrame,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ):
+        metadata = {
+            "fetched_at": datetime.now().isoformat(),
+            "etag": etag,
+            "last_modified": last_modified,
+        }
+        data_path, _ = self._get_paths(url)
+        try:
+            os.makedirs(os.path.dirname(data_path), exist_ok=True)
+            data.to_parquet(data_path)
+        except OSError as e:
+            logging.warning(f"Failed to write the web table cache of {url}: {e}")
+        self._write_metadata(url, data, metadata)
+
+    def touch(self, url: str):
+        data, metadata = self.get(url)
+        self._write_metadata(
+            url, data, {**metadata, "fetched_at": datetime.now().isoformat()}
+        )
+
+    def _write_metadata(self, url: str, data: pd.DataFrame, metadata: dict):
+        # The entry is kept in memory even when the disk is not writable, e.g.
+        # a read-only deployment, so warm invocations still reuse it.
+        with _web_tables_lock:
+            _web_tables[url] = (data, metadata)
+        _, metadata_path = self._get_paths(url)
+        try:
+            with open(metadata_path, "w") as f:
+                json.dump(metadata, f)
+        except OSError as e:
+            logging.warning(f"Failed to write the web table cache of {url}: {e}")
+
+
+if __name__ == "__main__":
+    cache_path = sys.argv[1] if len(sys.argv) > 1 else "price_history_cache"
+    print(PriceHistoryCache(get_local_path(cache_path)).info().to_string())
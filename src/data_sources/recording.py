@@ -0,0 +1,151 @@
+import gzip
+import hashlib
+import json
+import os
+from time import sleep
+from typing import Callable, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+# Query parameters that hold credentials. They are left out of the request
+# keys, so recordings neither contain them nor depend on them.
+CREDENTIAL_PARAMS = ("token", "apikey", "api_key", "access_key", "key")
+# Headers that describe the transfer of the recorded body rather than the body.
+TRANSFER_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+
+
+class ResponseRecorder:
+    """
+    Records responses on disk or replays them without touching the network.
+    Every request is stored under the sha256 of its method, url and body, as
+    a gzip file holding a JSON line with the status and headers followed by
+    the body. Data frames of sources that do not use the session pool, like
+    yfinance, are stored as parquet under the key of their request.
+    """
+
+    MODES = ("record", "replay")
+
+    def __init__(self, mode: str, path: str, replay_latency: float = 0) -> None:
+        if mode not in self.MODES:
+            raise ValueError(
+                f"Unknown recording mode {mode}, expected one of {self.MODES}"
+            )
+        self.mode = mode
+        self.path = path
+        self.replay_latency = replay_latency
+
+    def _get_path(self, key: str, extension: str) -> str:
+        return os.path.join(self.path, key[:2], f"{key}.{extension}")
+
+    def get_request_key(self, request: requests.PreparedRequest) -> str:
+        url = urlsplit(request.url)
+        query = urlencode(
+            sorted(
+                (name, value)
+                for name, value in parse_qsl(url.query, keep_blank_values=True)
+                if name.lower() not in CREDENTIAL_PARAMS
+            )
+        )
+        body = request.body or b""
+        if isinstance(body, str):
+            body = body.encode()
+
+        key = hashlib.sha256()
+        key.update(request.method.encode())
+        key.update(urlunsplit(url._replace(query=query)).encode())
+        key.update(body)
+        return key.hexdigest()
+
+    def read_response(
+        self, request: requests.PreparedRequest
+    ) -> Optional[requests.Response]:
+        response_path = self._get_path(self.get_request_key(request), "gz")
+        if not os.path.exists(response_path):
+            return None
+
+        with gzip.open(response_path, "rb") as f:
+            metadata, content = f.read().split(b"\n", 1)
+        metadata = json.loads(metadata)
+
+        response = requests.Response()
+        response.status_code = metadata["status_code"]
+        response.reason = metadata["reason"]
+        response.headers = CaseInsensitiveDict(metadata["headers"])
+        response.headers["Content-Length"] = str(len(content))
+        response._content = content
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        return response
+
+    def write_response(
+        self, request: requests.PreparedRequest, response: requests.Response
+    ):
+        response_path = self._get_path(self.get_request_key(request), "gz")
+        os.makedirs(os.path.dirname(response_path), exist_ok=True)
+        metadata = {
+            "status_code": response.status_code,
+            "reason": response.reason,
+            "headers": {
+                name: value
+                for name, value in response.headers.items()
+                if name.lower() not in TRANSFER_HEADERS and name.lower() != "set-cookie"
+            },
+        }
+        with gzip.open(response_path, "wb") as f:
+            f.write(json.dumps(metadata).encode() + b"\n" + response.content)
+
+    def frame(self, request: tuple, fetch: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """
+        Returns the recorded frame of the request in replay mode, otherwise
+        fetches it and records it. request is a JSON serializable tuple that
+        identifies the call.
+        """
+        key = hashlib.sha256(json.dumps(request, default=str).encode()).hexdigest()
+        frame_path = self._get_path(key, "parquet")
+
+        if self.mode == "replay":
+            if not os.path.exists(frame_path):
+                raise requests.ConnectionError(f"No recorded data for {request}")
+            if self.replay_latency:
+                sleep(self.replay_latency)
+            return pd.read_parquet(frame_path)
+
+        data = fetch()
+        if data is not None:
+            os.makedirs(os.path.dirname(frame_path), exist_ok=True)
+            data.to_parquet(frame_path)
+        return data
+
+
+class RecordingAdapter(HTTPAdapter):
+    """
+    Transport adapter that records the responses of the session it is mounted
+    on, or replays them with no network access.
+    """
+
+    def __init__(self, recorder: ResponseRecorder, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.recorder = recorder
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        if self.recorder.mode == "replay":
+            response = self.recorder.read_response(request)
+            if response is None:
+                raise requests.ConnectionError(
+                    f"No recorded response for {request.method} {request.url}",
+                    request=request,
+                )
+            if self.recorder.replay_latency:
+                sleep(self.recorder.replay_latency)
+            response.connection = self
+            return response
+
+        response = super().send(request, **kwargs)
+        self.recorder.write_response(request, response)
+        return response
@@ -1,18 +1,129 @@
 from abc import ABC, abstractmethod
-from datetime import datetime
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar, copy_context
+from datetime import date, datetime, timedelta
 import logging
+from threading import Lock
 from time import sleep
-from typing import Optional, Any
+from typing import Optional, Any, AsyncIterator, Iterable
+from urllib.parse import urlsplit
 
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException, HTTPError
-from bs4 import BeautifulSoup
-import yfinance as yf
 from dateutil.relativedelta import relativedelta
 
+from src.data_sources.cache import PriceHistoryCache, WebTableCache
+from src.data_sources.recording import RecordingAdapter, ResponseRecorder
+from src.instrumentation import count, instrumented
+from src.startup import lazy_import
+
+lxml_html = lazy_import("lxml.html")
+yf = lazy_import("yfinance")
+
+
+class HTTPSessionPool:
+    def __init__(
+        self,
+        pool_size: int = 10,
+        connect_timeout: float = 5,
+        read_timeout: float = 30,
+        recorder: Optional[ResponseRecorder] = None,
+    ) -> None:
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.recorder = recorder
+        self._recording = None
+        self._sessions = {}
+        self._lock = Lock()
+
+    @property
+    def timeout(self) -> tuple:
+        return (self.connect_timeout, self.read_timeout)
+
+    def configure(
+        self,
+        pool_size: Optional[int] = None,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        recording: Optional[dict] = None,
+    ):
+        self.connect_timeout = connect_timeout or self.connect_timeout
+        self.read_timeout = read_timeout or self.read_timeout
+        if pool_size and pool_size != self.pool_size:
+            self.pool_size = pool_size
+            self.close()
+        if recording is not None and recording != self._recording:
+            self._recording = recording
+            self.set_recorder(
+                ResponseRecorder(**recording) if recording.get("mode") else None
+            )
+
+    def set_recorder(self, recorder: Optional[ResponseRecorder]):
+        self.recorder = recorder
+        self.close()
+
+    def get_session(self, url: str) -> requests.Session:
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._sessions:
+                self._sessions[host] = self._create_session()
+            return self._sessions[host]
+
+    def _create_session(self) -> requests.Session:
+        session = requests.Session()
+        if self.recorder is not None:
+            adapter = RecordingAdapter(
+                self.recorder, pool_connections=1, pool_maxsize=self.pool_size
+            )
+        else:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update({"Accept-Encoding": "gzip, deflate"})
+        session.hooks["response"].append(_count_response)
+        return session
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+def _count_response(response: requests.Response, *args, **kwargs):
+    count("http_calls")
+    content_length = response.headers.get("Content-Length")
+    if content_length is not None:
+        count("http_bytes", int(content_length))
+
+
+HTTP_SESSION_POOL = HTTPSessionPool()
+
+# Blocking requests issued from the async entry points run here.
+ASYNC_FETCH_EXECUTOR = ThreadPoolExecutor(
+    max_workers=32, thread_name_prefix="async_fetch"
+)
+# Timeout of the requests of an async call. It is passed to requests, so a
+# slow host releases its executor thread instead of holding it after the
+# caller stopped waiting.
+REQUEST_TIMEOUT = ContextVar("request_timeout", default=None)
+
+
+def configure_http_session_pool(**http_config) -> HTTPSessionPool:
+    HTTP_SESSION_POOL.configure(**http_config)
+    return HTTP_SESSION_POOL
+
 
 class DataSource(ABC):
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        if "get_data" in cls.__dict__:
+            cls.get_data = instrumented(f"{cls.__name__}.get_data")(cls.get_data)
+
     @abstractmethod
     def get_data(self) -> Any:
         pass
@@ -27,6 +138,7 @@ class APISource(DataSource):
         params: Optional[dict] = None,
         on_error_wait: int = 30,
         on_error_max_retry: int = 3,
+        session_pool: Optional[HTTPSessionPool] = None,
     ):
         self.url = url
         self.method = method.upper()
@@ -34,24 +146,29 @@ class APISource(DataSource):
         self.params = params or {}
         self.on_error_wait = on_error_wait
         self.on_error_max_retry = on_error_max_retry
-        self._retries = 0
+        self.session_pool = session_pool or HTTP_SESSION_POOL
 
-    def get_data(self, url: Optional[str] = None) -> dict:
+    def get_data(
+        self, url: Optional[str] = None, params: Optional[dict] = None
+    ) -> dict:
         url = url or self.url
-        while self._retries < self.on_error_max_retry:
+        params = {**self.params, **(params or {})}
+        retries = 0
+        while retries < self.on_error_max_retry:
             try:
-                response = requests.request(
+                response = self.session_pool.get_session(url).request(
                     method=self.method,
                     url=url,
                     headers=self.headers,
-                    params=self.params,
+                    params=params,
+                    timeout=self.get_request_timeout(),
                 )
                 response.raise_for_status()
-                self._retries = 0
                 return response.json()
             except HTTPError as e:
                 if e.response.status_code == 429:
                     self._handle_rate_limit_exceeded()
+                    retries += 1
                 else:
                     logging.error(f"HTTP error fetching data from {url}: {e}")
                     return {}
@@ -60,33 +177,136 @@ class APISource(DataSource):
                 return {}
         return {}
 
+    def get_request_timeout(self) -> tuple:
+        request_timeout = REQUEST_TIMEOUT.get()
+        if request_timeout is None:
+            return self.session_pool.timeout
+        return (
+            min(self.session_pool.connect_timeout, request_timeout),
+            request_timeout,
+        )
+
+    async def get_data_async(self, *args, timeout: Optional[float] = None) -> dict:
+        """
+        Runs get_data on the fetch executor. The timeout applies to every
+        request it sends; a request that times out is logged and returns {}
+        like any other request error.
+        """
+        loop = asyncio.get_running_loop()
+        context = copy_context()
+        context.run(REQUEST_TIMEOUT.set, timeout)
+        return await loop.run_in_executor(
+            ASYNC_FETCH_EXECUTOR, context.run, self.get_data, *args
+        )
+
+    async def iter_data_async(
+        self,
+        keys: Iterable,
+        max_concurrency: int = 8,
+        timeout: Optional[float] = None,
+        args: tuple = (),
+    ) -> AsyncIterator[tuple]:
+        """
+        Yields (key, data) as the get_data(key, *args) requests complete.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def fetch(key) -> tuple:
+            async with semaphore:
+                return key, await self.get_data_async(key, *args, timeout=timeout)
+
+        for next_completed in asyncio.as_completed([fetch(key) for key in keys]):
+            yield await next_completed
+
     def _handle_rate_limit_exceeded(self):
         logging.warning(
             f"Rate limit exceeded. Retrying in {self.on_error_wait:.2f} seconds..."
         )
         sleep(self.on_error_wait)
-        self._retries += 1
 
 
 class UrlWebScraper(DataSource):
-    def __init__(self, url: str):
+    # Numbers as shown on web tables, e.g. "1,234.5", "-0.8%" or "3.51T".
+    NUMBER_PATTERN = r"^([-+]?\d[\d,]*(?:\.\d+)?)\s*([KMBT%]?)$"
+    MISSING_VALUES = ("", "-", "n/a")
+    UNIT_MULTIPLIERS = {"": 1, "%": 1, "K": 1e3, "M": 1e6, "B": 1e9, "T": 1e12}
+
+    def __init__(
+        self,
+        url: str,
+        session_pool: Optional[HTTPSessionPool] = None,
+        cache: Optional[WebTableCache] = None,
+    ):
         self.url = url
+        self.session_pool = session_pool or HTTP_SESSION_POOL
+        self.cache = cache
 
     def get_data(self) -> pd.DataFrame:
-        response = requests.get(self.url)
-        soup = BeautifulSoup(response.text, "lxml")
-        table = soup.find("table")
+        if self.cache is None:
+            return self.parse_first_table(self._fetch().content)
 
-        if not table:
+        table, metadata = self.cache.get(self.url)
+        if table is not None and self.cache.is_fresh(metadata):
+            return table.copy()
+
+        response = self._fetch(metadata)
+        if response.status_code == 304 and table is not None:
+            self.cache.touch(self.url)
+            return table.copy()
+
+        table = self.parse_first_table(response.content)
+        self.cache.put(
+            self.url,
+            table,
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+        )
+        return table.copy()
+
+    def _fetch(self, metadata: Optional[dict] = None) -> requests.Response:
+        headers = {}
+        if metadata and metadata.get("etag"):
+            headers["If-None-Match"] = metadata["etag"]
+        if metadata and metadata.get("last_modified"):
+            headers["If-Modified-Since"] = metadata["last_modified"]
+
+        response = self.session_pool.get_session(self.url).get(
+            self.url, headers=headers, timeout=self.session_pool.timeout
+        )
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response
+
+    def parse_first_table(self, content: bytes) -> pd.DataFrame:
+        """
+        Parses only the first table of the page and converts the columns whose
+        values are all numbers, percentages or K/M/B/T amounts to floats.
+        """
+        table = lxml_html.fromstring(content).find(".//table")
+        if table is None:
             return pd.DataFrame()
 
-        headers = [th.text.strip() for th in table.find_all("th")]
+        headers = [th.text_content().strip() for th in table.iter("th")]
         data = [
-            [td.text.strip() for td in row.find_all("td")]
-            for row in table.find_all("tr")
+            [td.text_content().strip() for td in cells]
+            for cells in (row.findall("td") for row in table.iter("tr"))
+            if cells
         ]
+        table = pd.DataFrame(data, columns=headers)
+        for col in table.columns:
+            table[col] = self.to_number(table[col])
+        return table
+
+    def to_number(self, values: pd.Series) -> pd.Series:
+        is_missing = values.isin(self.MISSING_VALUES)
+        parts = values.str.replace("$", "", regex=False).str.extract(
+            self.NUMBER_PATTERN
+        )
+        if parts[0].isna().ne(is_missing).any() or is_missing.all():
+            return values
 
-        return pd.DataFrame(data, columns=headers).dropna(how="all")
+        numbers = pd.to_numeric(parts[0].str.replace(",", "", regex=False))
+        return numbers * parts[1].map(self.UNIT_MULTIPLIERS)
 
 
 class FinancialModellingPrepStockDataInfo(APISource):
@@ -103,23 +323,281 @@ class FinnhubStockPrice(APISource):
 
 
 class YahooStockPriceHistory(DataSource):
-    def get_data(self, symbols: list, past_num_of_years: int) -> pd.DataFrame:
+    CACHE_NAMESPACE = "yahoo_stock_price_history"
+
+    def __init__(
+        self,
+        cache: Optional[PriceHistoryCache] = None,
+        batch_size: int = 0,
+        session_pool: Optional[HTTPSessionPool] = None,
+    ) -> None:
+        self.cache = cache
+        self.batch_size = batch_size
+        self.session_pool = session_pool or HTTP_SESSION_POOL
+        self.failed_symbols = []
+
+    def get_data(
+        self, symbols: list, past_num_of_years: int, since: Optional[date] = None
+    ) -> pd.DataFrame:
+        """
+        Returns the history of the past years, or from since when it is given.
+        """
         end_date = datetime.now()
         start_date = end_date - relativedelta(years=past_num_of_years)
+        if since is not None:
+            start_date = pd.Timestamp(since).to_pydatetime()
+        self.failed_symbols = []
+
+        if self.cache is not None:
+            return self._get_cached_histories(list(symbols), start_date, end_date)
+        if self.batch_size:
+            return self._download_in_batches(list(symbols), start_date, end_date)
 
         data = []
         for symbol in symbols:
-            ticker = yf.Ticker(symbol)
-            history = ticker.history(start=start_date, end=end_date)
+            history = self._ticker_history(symbol, start_date, end_date)
             if not history.empty:
                 history["symbol"] = symbol
                 data.append(history)
+            else:
+                self._report_failed_symbols([symbol])
 
         return pd.concat(data) if data else pd.DataFrame()
 
+    def _download_in_batches(
+        self,
+        symbols: list,
+        start_date: datetime,
+        end_date: datetime,
+        report_failures: bool = True,
+    ) -> pd.DataFrame:
+        """
+        Downloads the symbols with one multi-ticker request per batch and
+        returns them in the same long format as the per-ticker path, with a
+        'symbol' column. Symbols that return no rows are logged and kept in
+        'failed_symbols'.
+        """
+        data = []
+        for batch_start in range(0, len(symbols), self.batch_size):
+            batch = symbols[batch_start : batch_start + self.batch_size]
+            history = self._download(batch, start_date, end_date)
+            if history is None or history.empty:
+                if report_failures:
+                    self._report_failed_symbols(batch)
+                continue
+
+            history = (
+                history.stack(level="Ticker", future_stack=True)
+                .dropna(how="all")
+                .reset_index(level="Ticker")
+                .rename(columns={"Ticker": "symbol"})
+            )
+            history.columns.name = None
+            if report_failures:
+                self._report_failed_symbols(
+                    [symbol for symbol in batch if symbol not in set(history["symbol"])]
+                )
+            data.append(history)
+
+        if not data:
+            return pd.DataFrame()
+        data = pd.concat(data) if len(data) > 1 else data[0]
+        return data.loc[
+            :, [col for col in data.columns if col != "symbol"] + ["symbol"]
+        ]
+
+    def _ticker_history(
+        self, symbol: str, start_date: datetime, end_date: datetime
+    ) -> pd.DataFrame:
+        return self._recorded(
+            ("history", symbol, (end_date - start_date).days),
+            lambda: yf.Ticker(symbol).history(start=start_date, end=end_date),
+        )
+
+    def _download(
+        self, symbols: list, start_date: datetime, end_date: datetime
+    ) -> pd.DataFrame:
+        return self._recorded(
+            ("download", sorted(symbols), (end_date - start_date).days),
+            lambda: yf.download(
+                symbols,
+                start=start_date,
+                end=end_date,
+                actions=True,
+                auto_adjust=True,
+                ignore_tz=False,
+                group_by="ticker",
+                progress=False,
+            ),
+        )
+
+    def _recorded(self, request: tuple, fetch) -> pd.DataFrame:
+        # yfinance does not use the session pool, so its frames are recorded
+        # by the length of the requested window instead of the exact dates,
+        # which keeps replays valid on later days.
+        if self.session_pool.recorder is None:
+            return fetch()
+        return self.session_pool.recorder.frame(("yfinance", *request), fetch)
+
+    def _report_failed_symbols(self, symbols: list):
+        if symbols:
+            logging.warning(f"No price history downloaded for symbols: {symbols}")
+            self.failed_symbols.extend(symbols)
+
+    def _download_histories(self, fetch_starts: dict, end_date: datetime) -> dict:
+        if not self.batch_size:
+            return {
+                symbol: self._ticker_history(symbol, start, end_date)
+                for symbol, start in fetch_starts.items()
+            }
+
+        symbols_by_start = {}
+        for symbol, start in fetch_starts.items():
+            symbols_by_start.setdefault(start, []).append(symbol)
+
+        histories = {}
+        for start, symbols in symbols_by_start.items():
+            history = self._download_in_batches(
+                symbols, start, end_date, report_failures=False
+            )
+            if history.empty:
+                continue
+            for symbol, symbol_history in history.groupby("symbol", sort=False):
+                histories[symbol] = symbol_history.drop(columns="symbol")
+        return histories
+
+    def _get_cached_histories(
+        self, symbols: list, start_date: datetime, end_date: datetime
+    ) -> pd.DataFrame:
+        cached_histories = {}
+        fetch_starts = {}
+        for symbol in symbols:
+            cached, metadata = self.cache.read(self.CACHE_NAMESPACE, symbol)
+            if cached is None or pd.Timestamp(metadata["start"]) > start_date:
+                cached_histories[symbol] = (None, {"start": start_date.isoformat()})
+                fetch_starts[symbol] = start_date
+                continue
+
+            cached_histories[symbol] = (cached, metadata)
+            watermark = pd.Timestamp(metadata["watermark"])
+            top_up_start = watermark.tz_localize(None) + relativedelta(days=1)
+            if top_up_start.date() < end_date.date():
+                fetch_starts[symbol] = top_up_start.to_pydatetime()
+
+        new_histories = self._download_histories(fetch_starts, end_date)
+
+        data = []
+        failed_symbols = []
+        for symbol in symbols:
+            cached, metadata = cached_histories[symbol]
+            new_history = new_histories.get(symbol)
+            if new_history is not None and not new_history.empty:
+                if cached is None:
+                    cached = new_history
+                else:
+                    cached = pd.concat([cached, new_history])
+                    cached = cached[~cached.index.duplicated(keep="last")]
+                self.cache.write(
+                    self.CACHE_NAMESPACE, symbol, cached, cached.index.max(), metadata
+                )
+            if cached is None or cached.empty:
+                failed_symbols.append(symbol)
+                continue
+
+            window_start = pd.Timestamp(start_date).normalize()
+            if cached.index.tz is not None:
+                window_start = window_start.tz_localize(cached.index.tz)
+            history = cached[cached.index >= window_start]
+            history["symbol"] = symbol
+            data.append(history)
+
+        self._report_failed_symbols(failed_symbols)
+        return pd.concat(data) if data else pd.DataFrame()
+
 
 class CoinrankingCoinPriceHistory(APISource):
-    def get_data(self, uuid: str) -> dict:
+    CACHE_NAMESPACE = "coinranking_coin_price_history"
+    # Time periods accepted by the history endpoint, used for top-up fetches.
+    TIME_PERIODS = {
+        "24h": relativedelta(hours=24),
+        "7d": relativedelta(days=7),
+        "30d": relativedelta(days=30),
+        "3m": relativedelta(months=3),
+        "1y": relativedelta(years=1),
+        "3y": relativedelta(years=3),
+        "5y": relativedelta(years=5),
+    }
+
+    def __init__(
+        self, *args, cache: Optional[PriceHistoryCache] = None, **kwargs
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.cache = cache
+
+    def get_data(self, uuid: str, since: Optional[date] = None) -> dict:
+        """
+        Returns the history of the configured time period. Without a cache, a
+        since date requests the shortest time period that covers it instead.
+        """
         url = self.url.replace("<uuid>", uuid)
-        self.data = super().get_data(url)
-        return self.data
+        if self.cache is None:
+            if since is None:
+                return super().get_data(url)
+            since_gap = datetime.now() - pd.Timestamp(since).to_pydatetime()
+            time_period = self._get_top_up_time_period(since_gap) or "24h"
+            return super().get_data(url, params={"timePeriod": time_period})
+
+        cached, metadata = self.cache.read(self.CACHE_NAMESPACE, uuid)
+        if cached is None:
+            data = super().get_data(url)
+            if data:
+                history = pd.DataFrame.from_dict(data["data"]["history"])
+                self._write_cache(uuid, history)
+            return data
+
+        watermark = datetime.fromtimestamp(cached["timestamp"].max())
+        time_period = self._get_top_up_time_period(datetime.now() - watermark)
+        if time_period:
+            data = super().get_data(url, params={"timePeriod": time_period})
+            if data:
+                new_history = pd.DataFrame.from_dict(data["data"]["history"])
+                new_history = new_history[
+                    new_history["timestamp"] > cached["timestamp"].max()
+                ]
+                # The watermark day is deduplicated together with the cached
+                # rows, its newer price replaces the cached one.
+                cached = self._keep_last_price_of_each_day(
+                    pd.concat([new_history, cached], ignore_index=True)
+                )
+                self._write_cache(uuid, cached, metadata)
+
+        history_length = self.TIME_PERIODS.get(self.params.get("timePeriod"))
+        if history_length:
+            window_start = (datetime.now() - history_length).timestamp()
+            cached = cached[cached["timestamp"] >= window_start]
+        return {"data": {"history": cached.to_dict("records")}}
+
+    def _write_cache(
+        self, uuid: str, history: pd.DataFrame, metadata: Optional[dict] = None
+    ):
+        if history.empty:
+            return
+        history = history.loc[:, ["price", "timestamp"]]
+        watermark = datetime.fromtimestamp(history["timestamp"].max())
+        self.cache.write(self.CACHE_NAMESPACE, uuid, history, watermark, metadata)
+
+    def _get_top_up_time_period(self, gap: timedelta) -> Optional[str]:
+        if gap < timedelta(days=1):
+            return None
+
+        now = datetime.now()
+        for time_period, length in self.TIME_PERIODS.items():
+            if now - length <= now - gap:
+                return time_period
+        return self.params.get("timePeriod")
+
+    def _keep_last_price_of_each_day(self, history: pd.DataFrame) -> pd.DataFrame:
+        days = pd.to_datetime(history["timestamp"], unit="s").dt.date
+        return history.loc[history.groupby(days)["timestamp"].idxmax()].sort_values(
+            "timestamp", ascending=False
+        )
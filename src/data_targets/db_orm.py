@@ -1,3 +1,6 @@
+from functools import lru_cache
+import hashlib
+
 from sqlalchemy import (
     Column,
     String,
@@ -12,7 +15,6 @@ from sqlalchemy import (
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
-
 Base = declarative_base()
 
 
@@ -56,7 +58,7 @@ class DimDate(Base):
 
     __table_args__ = (
         CheckConstraint("day <= 31 AND day >= 0", name="day_check"),
-        CheckConstraint("week <= 52 AND week >= 0", name="week_check"),
+        CheckConstraint("week <= 53 AND week >= 0", name="week_check"),
         CheckConstraint("month <= 12 AND month >= 0", name="month_check"),
         CheckConstraint("quarter <= 4 AND quarter >= 0", name="quarter_check"),
         CheckConstraint("year >= 0", name="year_check"),
@@ -103,3 +105,46 @@ class FtStockPrice(Base):
     high = Column(Float, nullable=False)
     low = Column(Float, nullable=False)
     close = Column(Float, nullable=False)
+
+
+class PipelineRun(Base):
+    __tablename__ = "pipeline_run_t"
+    run_id = Column(Integer, primary_key=True, autoincrement=True)
+    pipeline = Column(String(255), nullable=False)
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime)
+
+    checkpoints = relationship("PipelineCheckpoint", backref="run")
+
+
+class PipelineCheckpoint(Base):
+    __tablename__ = "pipeline_checkpoint_t"
+    run_id = Column(Integer, ForeignKey("pipeline_run_t.run_id"), primary_key=True)
+    entity = Column(String(255), primary_key=True)
+    completed_at = Column(DateTime, nullable=False)
+
+
+class SchemaVersion(Base):
+    __tablename__ = "schema_version_t"
+    version = Column(String(64), primary_key=True)
+    applied_at = Column(DateTime, nullable=False)
+
+
+@lru_cache(maxsize=None)
+def get_schema_version() -> str:
+    """
+    Hash of the ORM table definitions. It changes whenever a table, column,
+    type, key or check constraint in this module changes.
+    """
+    definitions = []
+    for table in sorted(Base.metadata.tables.values(), key=lambda t: t.name):
+        definitions.append(table.name)
+        for col in table.columns:
+            definitions.append(
+                f"{col.name}:{col.type!r}:{col.primary_key}:{col.nullable}:"
+                f"{sorted(fk.target_fullname for fk in col.foreign_keys)}"
+            )
+        for constraint in table.constraints:
+            if isinstance(constraint, CheckConstraint):
+                definitions.append(f"{constraint.name}:{constraint.sqltext}")
+    return hashlib.sha256("\n".join(definitions).encode()).hexdigest()
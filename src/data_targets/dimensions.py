@@ -0,0 +1,46 @@
+from datetime import date
+
+import pandas as pd
+
+from .db_orm import DimDate, DimTime
+from src.transformations.transformations import Date, Time
+
+SECONDS_PER_DAY = 86_400
+
+
+def get_date_keys(data: pd.DataFrame) -> pd.Series:
+    """
+    Returns the yyyymmdd keys of the day, month and year columns.
+    """
+    return (data["year"] * 10_000 + data["month"] * 100 + data["day"]).astype("int64")
+
+
+def get_time_keys(data: pd.DataFrame) -> pd.Series:
+    """
+    Returns the seconds of day keys of the hour, minute and second columns.
+    """
+    return (data["hour"] * 3_600 + data["minute"] * 60 + data["second"]).astype("int64")
+
+
+def get_date_key_expression():
+    return DimDate.year * 10_000 + DimDate.month * 100 + DimDate.day
+
+
+def get_time_key_expression():
+    return DimTime.hour * 3_600 + DimTime.minute * 60 + DimTime.second
+
+
+def build_date_dimension(start_date: date | str, end_date: date | str) -> pd.DataFrame:
+    dates = pd.Series(pd.date_range(start_date, end_date, freq="D"))
+    data = Date().get_current_date(dates)
+    data.insert(0, "date_id", get_date_keys(data))
+    return data
+
+
+def build_time_dimension() -> pd.DataFrame:
+    times = pd.Series(
+        pd.Timestamp(2000, 1, 1) + pd.to_timedelta(range(SECONDS_PER_DAY), unit="s")
+    )
+    data = Time().get_current_time(times)
+    data.insert(0, "time_id", get_time_keys(data))
+    return data
@@ -0,0 +1,87 @@
+from threading import Lock, local
+from typing import Optional
+
+from sqlalchemy import create_engine, event, Engine
+
+from src.instrumentation import count
+
+_engines = {}
+_engines_lock = Lock()
+_statement_counters = local()
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class StatementCounter:
+    """
+    Counts the statements the current thread executes on any engine while the
+    counter is active. Counters can be nested. With a budget, leaving the
+    block raises QueryBudgetExceeded if more statements were executed.
+    """
+
+    def __init__(self, budget: Optional[int] = None, description: str = "") -> None:
+        self.budget = budget
+        self.description = description
+        self.statements = 0
+
+    def __enter__(self) -> "StatementCounter":
+        if not hasattr(_statement_counters, "active"):
+            _statement_counters.active = []
+        _statement_counters.active.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _statement_counters.active.remove(self)
+        if exc_type is None and self.budget is not None:
+            if self.statements > self.budget:
+                raise QueryBudgetExceeded(
+                    f"{self.description or 'Block'} executed {self.statements} "
+                    f"statements, the budget is {self.budget}"
+                )
+
+
+def query_budget(budget: int, description: str = "") -> StatementCounter:
+    return StatementCounter(budget, description)
+
+
+def get_engine(
+    connection_string: str,
+    pool_size: int = 5,
+    max_overflow: int = 5,
+    pool_recycle: int = 1800,
+    pool_pre_ping: bool = True,
+) -> Engine:
+    """
+    Returns the process-wide engine of the connection string, creating it on
+    first use, so warm invocations reuse the pooled connections.
+    """
+    with _engines_lock:
+        if connection_string not in _engines:
+            engine_options = {
+                "pool_pre_ping": pool_pre_ping,
+                "pool_recycle": pool_recycle,
+            }
+            if not connection_string.startswith("sqlite"):
+                engine_options["pool_size"] = pool_size
+                engine_options["max_overflow"] = max_overflow
+            if connection_string.startswith("mssql+pyodbc"):
+                engine_options["fast_executemany"] = True
+            engine = create_engine(connection_string, **engine_options)
+            event.listen(engine, "before_cursor_execute", _count_round_trip)
+            _engines[connection_string] = engine
+        return _engines[connection_string]
+
+
+def _count_round_trip(*args):
+    count("db_round_trips")
+    for counter in getattr(_statement_counters, "active", ()):
+        counter.statements += 1
+
+
+def dispose_engines():
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
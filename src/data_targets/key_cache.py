@@ -0,0 +1,71 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Hashable, Optional
+
+
+class DimensionKeyCache:
+    def __init__(self, max_size: int = 100_000) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.warmed_up = set()
+        self._keys = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, cache_key: Hashable) -> Optional[Any]:
+        with self._lock:
+            if cache_key in self._keys:
+                self._keys.move_to_end(cache_key)
+                self.hits += 1
+                return self._keys[cache_key]
+            self.misses += 1
+            return None
+
+    def put(self, cache_key: Hashable, value: Any):
+        with self._lock:
+            self._keys[cache_key] = value
+            self._keys.move_to_end(cache_key)
+            while len(self._keys) > self.max_size:
+                self._keys.popitem(last=False)
+                self.evictions += 1
+
+    def update(self, items: dict):
+        for cache_key, value in items.items():
+            self.put(cache_key, value)
+
+    def resize(self, max_size: int):
+        with self._lock:
+            self.max_size = max_size
+            while len(self._keys) > self.max_size:
+                self._keys.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+            self.warmed_up.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._keys),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+_dimension_key_cache = None
+
+
+def get_dimension_key_cache(max_size: int) -> DimensionKeyCache:
+    global _dimension_key_cache
+    if _dimension_key_cache is None:
+        _dimension_key_cache = DimensionKeyCache(max_size)
+    elif _dimension_key_cache.max_size != max_size:
+        _dimension_key_cache.resize(max_size)
+    return _dimension_key_cache
@@ -1,8 +1,26 @@
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import lru_cache
+from itertools import chain
+import logging
+from threading import Lock
 from time import sleep
+from typing import Iterable, Optional
 
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import (
+    text,
+    select,
+    insert,
+    update,
+    delete,
+    exists,
+    and_,
+    func,
+)
+from sqlalchemy.schema import AddConstraint, DropConstraint
+from sqlalchemy.sql import table, column, TableClause
 from sqlalchemy.orm import sessionmaker, session, DeclarativeBase
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.inspection import inspect
@@ -15,8 +33,23 @@ from .db_orm import (
     FtCoinPrice,
     FtStockPrice,
     Predictions,
+    PipelineCheckpoint,
+    PipelineRun,
+    SchemaVersion,
     Base,
+    get_schema_version,
+)
+from .dimensions import (
+    build_date_dimension,
+    build_time_dimension,
+    get_date_key_expression,
+    get_date_keys,
+    get_time_key_expression,
+    get_time_keys,
 )
+from .engines import StatementCounter, get_engine
+from .key_cache import get_dimension_key_cache
+from src.instrumentation import count, stage
 from src.transformations.transformations import Transformer
 
 
@@ -26,23 +59,102 @@ class DataTarget(ABC):
         pass
 
 
+@lru_cache(maxsize=None)
+def _model_column_names(
+    model: DeclarativeBase, only_primary_keys: bool, exclude_primary_key: bool
+) -> tuple:
+    all_columns = [col.key for col in model.__table__.columns]
+
+    if only_primary_keys:
+        mapper = inspect(model).mapper
+        return tuple(col.name for col in mapper.primary_key)
+    elif exclude_primary_key:
+        mapper = inspect(model).mapper
+        primary_key_columns = [col.name for col in mapper.primary_key]
+        return tuple(col for col in all_columns if col not in primary_key_columns)
+    else:
+        return tuple(all_columns)
+
+
+# (connection string, schema version) pairs already checked by this process.
+_verified_schemas = set()
+_verified_schemas_lock = Lock()
+# (connection string, calendar start, calendar end) tuples whose date and time
+# dimensions were already migrated to smart keys and filled by this process.
+_prepared_dimensions = set()
+_prepared_dimensions_lock = Lock()
+
+
+def _count_rows_written(batches: Iterable[pd.DataFrame]) -> Iterable[pd.DataFrame]:
+    for batch in batches:
+        count("rows_written", len(batch))
+        yield batch
+
+
 class Database(DataTarget):
-    def __init__(self, connection_string: str, max_retries=3, delay=30) -> None:
+    # Dimensions whose surrogate keys are cached, with the flag that tells
+    # whether their primary key is part of the natural attributes or not.
+    CACHED_DIMENSIONS = (
+        (DimDate, True),
+        (DimTime, True),
+        (DimCoin, False),
+        (DimStock, False),
+    )
+    # Check constraints changed after their tables were first created, which
+    # create_all does not alter on existing tables.
+    UPGRADED_CONSTRAINTS = ((DimDate, "week_check"),)
+
+    def __init__(
+        self,
+        connection_string: str,
+        max_retries=3,
+        delay=30,
+        bulk_load=False,
+        key_cache_size=0,
+        engine_options=None,
+        chunk_size=0,
+        resume_window_hours=12,
+        batch_size=0,
+        smart_dimension_keys=False,
+        calendar_start_date="2015-01-01",
+        calendar_end_date="2035-12-31",
+    ) -> None:
         self.connection_string = connection_string
+        self.engine_options = engine_options or {}
         self.engine = None
         self.Session = None
         self.max_retries = max_retries
         self.delay = delay
+        self.bulk_load = bulk_load
+        self.chunk_size = chunk_size
+        self.resume_window_hours = resume_window_hours
+        self.batch_size = batch_size
+        self.smart_dimension_keys = smart_dimension_keys
+        self.calendar_start_date = calendar_start_date
+        self.calendar_end_date = calendar_end_date
+        # Only the row by row path looks keys up, the bulk path resolves them
+        # in the database, so it neither builds nor warms up the cache.
+        self.key_cache = (
+            get_dimension_key_cache(key_cache_size)
+            if key_cache_size > 0 and not bulk_load
+            else None
+        )
+        self._pending_keys = {}
+        self.last_save_statements = None
         self._initialize_with_retry()
+        if self.key_cache is not None:
+            self.warm_up_key_cache()
         super().__init__()
 
     def _initialize_with_retry(self):
         retries = 0
         while retries < self.max_retries:
             try:
-                self.engine = create_engine(self.connection_string)
+                self.engine = get_engine(self.connection_string, **self.engine_options)
                 self.Session = sessionmaker(bind=self.engine)
-                Base.metadata.create_all(self.engine)
+                self._ensure_schema()
+                if self.smart_dimension_keys:
+                    self._ensure_smart_dimension_keys()
                 return
             except SQLAlchemyError as e:
                 retries += 1
@@ -56,22 +168,425 @@ class Database(DataTarget):
 
                 sleep(self.delay)
 
+    def _ensure_schema(self):
+        """
+        Creates the tables only when the ORM definitions changed since the
+        schema was last created, instead of running create_all on every run.
+        """
+        schema_version = get_schema_version()
+        with _verified_schemas_lock:
+            if (self.connection_string, schema_version) in _verified_schemas:
+                return
+
+            try:
+                with self.engine.connect() as connection:
+                    is_current = connection.execute(
+                        select(SchemaVersion.version).where(
+                            SchemaVersion.version == schema_version
+                        )
+                    ).first()
+            except SQLAlchemyError:
+                is_current = None
+
+            if is_current is None:
+                logging.info(f"Creating database schema version {schema_version}")
+                Base.metadata.create_all(self.engine)
+                self._upgrade_constraints()
+                with self.Session() as session:
+                    session.add(
+                        SchemaVersion(version=schema_version, applied_at=datetime.now())
+                    )
+                    session.commit()
+
+            _verified_schemas.add((self.connection_string, schema_version))
+
+    def _upgrade_constraints(self):
+        # SQLite cannot alter constraints, its tables keep the ones they were
+        # created with.
+        if self.engine.dialect.name == "sqlite":
+            return
+
+        for model, name in self.UPGRADED_CONSTRAINTS:
+            constraint = next(
+                constraint
+                for constraint in model.__table__.constraints
+                if constraint.name == name
+            )
+            try:
+                with self.engine.begin() as connection:
+                    connection.execute(DropConstraint(constraint))
+                    connection.execute(AddConstraint(constraint))
+            except SQLAlchemyError as e:
+                logging.warning(
+                    f"Failed to upgrade constraint {name} of {model.__tablename__}: {e}"
+                )
+
+    def _ensure_smart_dimension_keys(self):
+        """
+        Moves date and time rows keyed by surrogate keys to their yyyymmdd
+        and seconds of day keys, then fills dim_date_t for the calendar range
+        and dim_time_t with every second of the day, so fact rows compute
+        their date and time keys instead of looking them up.
+        """
+        prepared_key = (
+            self.connection_string,
+            self.calendar_start_date,
+            self.calendar_end_date,
+        )
+        with _prepared_dimensions_lock:
+            if prepared_key in _prepared_dimensions:
+                return
+
+            def prepare(session: session):
+                self.migrate_dimension_keys(session, DimDate, get_date_key_expression())
+                self.migrate_dimension_keys(session, DimTime, get_time_key_expression())
+                for model, data in (
+                    (
+                        DimDate,
+                        build_date_dimension(
+                            self.calendar_start_date, self.calendar_end_date
+                        ),
+                    ),
+                    (DimTime, build_time_dimension()),
+                ):
+                    self.insert_missing_dimension_keys(session, model, data)
+
+            self._run_in_transaction(prepare)
+            _prepared_dimensions.add(prepared_key)
+
+    @contextmanager
+    def identity_insert(self, session: session, model: DeclarativeBase):
+        """
+        Allows explicit values in the identity column of the model on SQL
+        Server. SQLAlchemy does this by itself for inserts with values, not
+        for INSERT ... SELECT.
+        """
+        is_mssql = self.engine.dialect.name == "mssql"
+        if is_mssql:
+            session.execute(text(f"SET IDENTITY_INSERT {model.__tablename__} ON"))
+        try:
+            yield
+        finally:
+            if is_mssql:
+                session.execute(text(f"SET IDENTITY_INSERT {model.__tablename__} OFF"))
+
+    def reset_identity(self, session: session, model: DeclarativeBase):
+        """
+        Moves the identity or sequence of the model's primary key past its
+        largest value after rows were inserted with explicit keys, so keys
+        generated later, e.g. with smart keys turned off again, do not
+        collide with them. SQLite always continues after the largest key.
+        """
+        dialect = self.engine.dialect.name
+        table_name = model.__tablename__
+        primary_key = self.get_model_column_names(model, only_primary_keys=True)[0]
+        if dialect == "postgresql":
+            session.execute(
+                text(
+                    f"SELECT setval(pg_get_serial_sequence('{table_name}', "
+                    f"'{primary_key}'), COALESCE(MAX({primary_key}), 0) + 1, false) "
+                    f"FROM {table_name}"
+                )
+            )
+        elif dialect == "mssql":
+            max_key = session.scalar(select(func.max(getattr(model, primary_key))))
+            if max_key is not None:
+                session.execute(
+                    text(f"DBCC CHECKIDENT ('{table_name}', RESEED, {int(max_key)})")
+                )
+
+    def migrate_dimension_keys(
+        self, session: session, model: DeclarativeBase, key_expression
+    ):
+        """
+        Rekeys the rows of the dimension whose primary key differs from the
+        key expression, together with the fact rows referencing them. The rows
+        are first copied to their new key plus an offset above every existing
+        and new key, so they never collide with old keys that are still
+        referenced, and moved down to the new key once the old rows are
+        deleted.
+        """
+        dimension = model.__table__
+        primary_key = dimension.c[
+            self.get_model_column_names(model, only_primary_keys=True)[0]
+        ]
+        is_old_key = primary_key != key_expression
+        if not session.scalar(select(exists().where(is_old_key))):
+            return
+
+        offset = (
+            max(
+                session.execute(
+                    select(func.max(primary_key), func.max(key_expression))
+                ).one()
+            )
+            + 1
+        )
+        columns = self.get_model_column_names(model)
+        foreign_keys = [
+            foreign_key.parent
+            for fact in Base.metadata.sorted_tables
+            for foreign_key in fact.foreign_keys
+            if foreign_key.column is primary_key
+        ]
+        logging.info(f"Migrating {dimension.name} to smart keys")
+
+        with self.identity_insert(session, model):
+            session.execute(
+                insert(dimension).from_select(
+                    [primary_key.name, *columns],
+                    select(
+                        (key_expression + offset).label(primary_key.name),
+                        *[func.min(dimension.c[col]).label(col) for col in columns],
+                    )
+                    .where(is_old_key)
+                    .group_by(key_expression),
+                )
+            )
+        for foreign_key in foreign_keys:
+            session.execute(
+                update(foreign_key.table)
+                .where(
+                    foreign_key.in_(
+                        select(primary_key).where(is_old_key, primary_key < offset)
+                    )
+                )
+                .values(
+                    {
+                        foreign_key.name: select(key_expression + offset)
+                        .where(primary_key == foreign_key)
+                        .scalar_subquery()
+                    }
+                )
+            )
+        session.execute(delete(dimension).where(is_old_key, primary_key < offset))
+
+        existing = dimension.alias("existing")
+        with self.identity_insert(session, model):
+            session.execute(
+                insert(dimension).from_select(
+                    [primary_key.name, *columns],
+                    select(
+                        (primary_key - offset).label(primary_key.name),
+                        *[dimension.c[col] for col in columns],
+                    ).where(
+                        primary_key >= offset,
+                        ~exists().where(
+                            existing.c[primary_key.name] == primary_key - offset
+                        ),
+                    ),
+                )
+            )
+        for foreign_key in foreign_keys:
+            session.execute(
+                update(foreign_key.table)
+                .where(foreign_key >= offset)
+                .values({foreign_key.name: foreign_key - offset})
+            )
+        session.execute(delete(dimension).where(primary_key >= offset))
+        self.reset_identity(session, model)
+
+    def insert_missing_dimension_keys(
+        self, session: session, model: DeclarativeBase, data: pd.DataFrame
+    ):
+        """
+        Inserts the rows of data, which hold their own primary keys, that are
+        not in the dimension yet.
+        """
+        primary_key_name = self.get_model_column_names(model, only_primary_keys=True)[0]
+        primary_key = getattr(model, primary_key_name)
+        keys = data[primary_key_name]
+        in_range = primary_key.between(int(keys.min()), int(keys.max()))
+        if session.scalar(select(func.count()).where(in_range)) == len(keys):
+            return
+
+        existing_keys = session.scalars(select(primary_key).where(in_range)).all()
+        missing = data[~keys.isin(existing_keys)]
+        if not missing.empty:
+            columns = self.get_model_column_names(model, exclude_primary_key=False)
+            session.execute(insert(model), missing[list(columns)].to_dict("records"))
+            self.reset_identity(session, model)
+
+    def add_smart_dimension_keys(
+        self, session: session, data: pd.DataFrame
+    ) -> pd.DataFrame:
+        """
+        Adds the date_id and time_id columns computed from the date and time
+        attributes. Dates outside of the calendar range are added to
+        dim_date_t, the others are there already.
+        """
+        data = data.assign(date_id=get_date_keys(data), time_id=get_time_keys(data))
+        calendar_start_key, calendar_end_key = (
+            int(pd.Timestamp(day).strftime("%Y%m%d"))
+            for day in (self.calendar_start_date, self.calendar_end_date)
+        )
+        is_outside_calendar = (data["date_id"] < calendar_start_key) | (
+            data["date_id"] > calendar_end_key
+        )
+        if is_outside_calendar.any():
+            self.insert_missing_dimension_keys(
+                session,
+                DimDate,
+                data.loc[is_outside_calendar].drop_duplicates("date_id"),
+            )
+        return data
+
+    def get_date_time_keys(self, session: session, row: pd.Series) -> tuple:
+        if self.smart_dimension_keys:
+            return int(row["date_id"]), int(row["time_id"])
+
+        date_id = self.get_or_create_key(
+            session, DimDate, **row[self.get_model_column_names(DimDate)]
+        )
+        time_id = self.get_or_create_key(
+            session, DimTime, **row[self.get_model_column_names(DimTime)]
+        )
+        return date_id, time_id
+
+    def get_date_time_columns(self) -> list:
+        if self.smart_dimension_keys:
+            return ["date_id", "time_id"]
+        return [
+            *self.get_model_column_names(DimDate),
+            *self.get_model_column_names(DimTime),
+        ]
+
+    def insert_missing_date_time_rows(self, session: session, staging: TableClause):
+        # Smart keys are computed from the rows and are in the dimensions.
+        if self.smart_dimension_keys:
+            return
+
+        self.insert_missing_dimension_rows(session, DimDate, staging, ["date"])
+        self.insert_missing_dimension_rows(session, DimTime, staging, ["time"])
+
     def save(self, transformer: Transformer):
+        with stage(f"{type(self).__name__}.save"), StatementCounter() as statements:
+            entities = transformer.get_entities() if self.chunk_size > 0 else None
+            if entities is not None:
+                self.save_in_chunks(transformer, entities)
+            elif self.batch_size > 0:
+                self._run_in_transaction(
+                    lambda session: self._save_batches(
+                        session,
+                        _count_rows_written(transformer.iter_batches(self.batch_size)),
+                    )
+                )
+            else:
+                self._run_in_transaction(
+                    lambda session: self._save_transformed(session, transformer)
+                )
+
+        self.last_save_statements = statements.statements
+        logging.info(
+            f"{type(self).__name__}.save executed {statements.statements} statements"
+        )
+        if self.key_cache is not None:
+            logging.info(f"Dimension key cache: {self.key_cache.stats()}")
+
+    def _save_transformed(self, session: session, transformer: Transformer):
+        data = transformer.transform()
+        count("rows_written", len(data))
+        self._save_data(session, data)
+
+    def _run_in_transaction(self, work):
         with self.Session() as session:
             session.begin()
             try:
-                data = transformer.transform()
-                self._save_data(session, data)
+                work(session)
                 session.commit()
+                self._commit_pending_keys()
             except SQLAlchemyError as e:
                 session.rollback()
+                self._pending_keys.clear()
                 raise SQLAlchemyError(f"Failed to save data: {e}")
             except Exception as e:
+                self._pending_keys.clear()
                 raise Exception(f"Error happened: {e}")
 
+    def save_in_chunks(self, transformer: Transformer, entities: list):
+        """
+        Transforms and saves the entities in chunks of chunk_size, committing
+        every chunk together with its checkpoint rows. A run that did not
+        finish is resumed by the next save within resume_window_hours and
+        skips the entities it already completed.
+        """
+        pipeline = type(transformer).__name__
+        run_id, completed_entities = self.get_or_create_pipeline_run(pipeline)
+        remaining_entities = [
+            entity for entity in entities if str(entity) not in completed_entities
+        ]
+        logging.info(
+            f"{pipeline} run {run_id}: {len(completed_entities)} entities already "
+            f"completed, {len(remaining_entities)} remaining"
+        )
+
+        def save_chunk(session: session, chunk: list):
+            data = transformer.transform_entities(chunk)
+            count("rows_written", len(data))
+            if not data.empty:
+                self._save_chunk(session, data, chunk)
+            completed_at = datetime.now()
+            session.add_all(
+                PipelineCheckpoint(
+                    run_id=run_id, entity=str(entity), completed_at=completed_at
+                )
+                for entity in chunk
+            )
+
+        for start in range(0, len(remaining_entities), self.chunk_size):
+            chunk = remaining_entities[start : start + self.chunk_size]
+            self._run_in_transaction(lambda session: save_chunk(session, chunk))
+
+        def finish_run(session: session):
+            self._finish_chunked_save(session, run_id)
+            session.execute(
+                update(PipelineRun)
+                .where(PipelineRun.run_id == run_id)
+                .values(finished_at=datetime.now())
+            )
+
+        self._run_in_transaction(finish_run)
+
+    def get_or_create_pipeline_run(self, pipeline: str) -> tuple:
+        resume_after = datetime.now() - timedelta(hours=self.resume_window_hours)
+        with self.Session() as session:
+            run = session.scalars(
+                select(PipelineRun)
+                .where(
+                    PipelineRun.pipeline == pipeline,
+                    PipelineRun.finished_at.is_(None),
+                    PipelineRun.started_at >= resume_after,
+                )
+                .order_by(PipelineRun.started_at.desc())
+            ).first()
+
+            if run is None:
+                run = PipelineRun(pipeline=pipeline, started_at=datetime.now())
+                session.add(run)
+                session.commit()
+                return run.run_id, set()
+
+            completed_entities = session.scalars(
+                select(PipelineCheckpoint.entity).where(
+                    PipelineCheckpoint.run_id == run.run_id
+                )
+            ).all()
+            return run.run_id, set(completed_entities)
+
     def _save_data(self, session: session, data: pd.DataFrame):
         raise NotImplementedError("This method must be implemented by subclasses")
 
+    def _save_batches(self, session: session, batches: Iterable[pd.DataFrame]):
+        for batch in batches:
+            if not batch.empty:
+                self._save_data(session, batch)
+
+    def _save_chunk(self, session: session, data: pd.DataFrame, entities: list):
+        self._save_data(session, data)
+
+    def _finish_chunked_save(self, session: session, run_id: int):
+        pass
+
     def truncate_table(self, table_object: DeclarativeBase):
         with self.engine.connect() as connection:
             transaction = connection.begin()
@@ -93,20 +608,157 @@ class Database(DataTarget):
             session.refresh(instance)
             return instance, True
 
+    def get_or_create_key(self, session: session, model, **kwargs):
+        """
+        Keys resolved inside the transaction may belong to rows it created, so
+        they are only published to the process wide cache once it commits.
+        """
+        cache_key = (
+            self.connection_string,
+            model.__tablename__,
+            tuple(sorted(kwargs.items())),
+        )
+        if self.key_cache is not None:
+            key = self._pending_keys.get(cache_key)
+            if key is None:
+                key = self.key_cache.get(cache_key)
+            if key is not None:
+                return key
+
+        instance, _ = self.get_or_create(session, model, **kwargs)
+        primary_key = self.get_model_column_names(model, only_primary_keys=True)[0]
+        key = getattr(instance, primary_key)
+
+        if self.key_cache is not None:
+            self._pending_keys[cache_key] = key
+        return key
+
+    def warm_up_key_cache(self):
+        if self.connection_string in self.key_cache.warmed_up:
+            return
+
+        with self.Session() as session:
+            for model, exclude_primary_key in self.CACHED_DIMENSIONS:
+                if self.smart_dimension_keys and model in (DimDate, DimTime):
+                    continue
+                columns = self.get_model_column_names(
+                    model, exclude_primary_key=exclude_primary_key
+                )
+                primary_key = self.get_model_column_names(
+                    model, only_primary_keys=True
+                )[0]
+                rows = session.execute(
+                    select(model.__table__).limit(self.key_cache.max_size)
+                ).mappings()
+                for row in rows:
+                    cache_key = (
+                        self.connection_string,
+                        model.__tablename__,
+                        tuple(sorted((col, row[col]) for col in columns)),
+                    )
+                    self.key_cache.put(cache_key, row[primary_key])
+
+        self.key_cache.warmed_up.add(self.connection_string)
+
+    def _commit_pending_keys(self):
+        if self.key_cache is not None:
+            self.key_cache.update(self._pending_keys)
+        self._pending_keys.clear()
+
     def get_model_column_names(
         self, model: DeclarativeBase, only_primary_keys=False, exclude_primary_key=True
     ) -> list:
-        all_columns = [col.key for col in model.__table__.columns]
-
-        if only_primary_keys:
-            mapper = inspect(model).mapper
-            return [col.name for col in mapper.primary_key]
-        elif exclude_primary_key:
-            mapper = inspect(model).mapper
-            primary_key_columns = [col.name for col in mapper.primary_key]
-            return [col for col in all_columns if col not in primary_key_columns]
+        return list(_model_column_names(model, only_primary_keys, exclude_primary_key))
+
+    def create_staging_table(
+        self,
+        session: session,
+        data: pd.DataFrame,
+        table_name: str,
+        dtype=None,
+        if_exists="replace",
+    ) -> TableClause:
+        data.to_sql(
+            table_name,
+            session.connection(),
+            if_exists=if_exists,
+            index=False,
+            dtype=dtype,
+        )
+        return table(table_name, *[column(col) for col in data.columns])
+
+    def drop_staging_table(self, session: session, staging: TableClause):
+        session.execute(text(f"DROP TABLE {staging.name}"))
+
+    def insert_missing_dimension_rows(
+        self,
+        session: session,
+        model: DeclarativeBase,
+        staging: TableClause,
+        natural_keys: list,
+        exclude_primary_key=True,
+    ):
+        columns = self.get_model_column_names(
+            model, exclude_primary_key=exclude_primary_key
+        )
+        is_existing_row = exists().where(
+            and_(*[getattr(model, key) == staging.c[key] for key in natural_keys])
+        )
+        rows_to_insert = (
+            select(
+                *[
+                    (
+                        staging.c[col]
+                        if col in natural_keys
+                        else func.min(staging.c[col]).label(col)
+                    )
+                    for col in columns
+                ]
+            )
+            .where(~is_existing_row)
+            .group_by(*[staging.c[key] for key in natural_keys])
+        )
+        session.execute(insert(model).from_select(columns, rows_to_insert))
+
+    def insert_missing_fact_rows(
+        self,
+        session: session,
+        model: DeclarativeBase,
+        staging: TableClause,
+        entity_key: str,
+        value_columns: list,
+    ):
+        primary_keys = self.get_model_column_names(model, only_primary_keys=True)
+        if self.smart_dimension_keys:
+            rows = select(
+                staging.c[entity_key],
+                staging.c.time_id,
+                staging.c.date_id,
+                *[staging.c[col] for col in value_columns],
+            ).subquery()
         else:
-            return all_columns
+            rows = (
+                select(
+                    staging.c[entity_key],
+                    DimTime.time_id,
+                    DimDate.date_id,
+                    *[staging.c[col] for col in value_columns],
+                )
+                .select_from(staging)
+                .join(DimTime, DimTime.time == staging.c.time)
+                .join(DimDate, DimDate.date == staging.c.date)
+                .subquery()
+            )
+        is_existing_row = exists().where(
+            and_(*[getattr(model, key) == rows.c[key] for key in primary_keys])
+        )
+        columns = [entity_key, "time_id", "date_id", *value_columns]
+        session.execute(
+            insert(model).from_select(
+                columns,
+                select(*[rows.c[col] for col in columns]).where(~is_existing_row),
+            )
+        )
 
     def does_row_exist(self, session: session, model: DeclarativeBase):
         try:
@@ -119,15 +771,19 @@ class Database(DataTarget):
 
 
 class DBCoinTarget(Database):
+    STAGING_TABLE = "stg_coin_price_t"
+    VALUE_COLUMNS = ["price", "change", "rank"]
+
     def _save_data(self, session: session, data: pd.DataFrame):
+        if self.bulk_load:
+            return self._bulk_save_data(session, data)
+
+        if self.smart_dimension_keys:
+            data = self.add_smart_dimension_keys(session, data)
+
         for _, row in data.iterrows():
-            date, _ = self.get_or_create(
-                session, DimDate, **row[self.get_model_column_names(DimDate)]
-            )
-            time, _ = self.get_or_create(
-                session, DimTime, **row[self.get_model_column_names(DimTime)]
-            )
-            coin, _ = self.get_or_create(
+            date_id, time_id = self.get_date_time_keys(session, row)
+            uuid = self.get_or_create_key(
                 session,
                 DimCoin,
                 **row[self.get_model_column_names(DimCoin, exclude_primary_key=False)],
@@ -136,9 +792,9 @@ class DBCoinTarget(Database):
             change = row["change"]
             rank = row["rank"]
             coin_price = FtCoinPrice(
-                uuid=coin.uuid,
-                time_id=time.time_id,
-                date_id=date.date_id,
+                uuid=uuid,
+                time_id=time_id,
+                date_id=date_id,
                 price=price,
                 change=change,
                 rank=rank,
@@ -146,17 +802,42 @@ class DBCoinTarget(Database):
             if not self.does_row_exist(session, coin_price):
                 session.add(coin_price)
 
+    def _bulk_save_data(self, session: session, data: pd.DataFrame):
+        if self.smart_dimension_keys:
+            data = self.add_smart_dimension_keys(session, data)
+
+        columns = [
+            *self.get_date_time_columns(),
+            *self.get_model_column_names(DimCoin, exclude_primary_key=False),
+            *self.VALUE_COLUMNS,
+        ]
+        staging = self.create_staging_table(
+            session, data.loc[:, columns], self.STAGING_TABLE
+        )
+        self.insert_missing_date_time_rows(session, staging)
+        self.insert_missing_dimension_rows(
+            session, DimCoin, staging, ["uuid"], exclude_primary_key=False
+        )
+        self.insert_missing_fact_rows(
+            session, FtCoinPrice, staging, "uuid", self.VALUE_COLUMNS
+        )
+        self.drop_staging_table(session, staging)
+
 
 class DBStockTarget(Database):
+    STAGING_TABLE = "stg_stock_price_t"
+    VALUE_COLUMNS = ["open", "high", "low", "close"]
+
     def _save_data(self, session: session, data: pd.DataFrame):
+        if self.bulk_load:
+            return self._bulk_save_data(session, data)
+
+        if self.smart_dimension_keys:
+            data = self.add_smart_dimension_keys(session, data)
+
         for _, row in data.iterrows():
-            date, _ = self.get_or_create(
-                session, DimDate, **row[self.get_model_column_names(DimDate)]
-            )
-            time, _ = self.get_or_create(
-                session, DimTime, **row[self.get_model_column_names(DimTime)]
-            )
-            stock, _ = self.get_or_create(
+            date_id, time_id = self.get_date_time_keys(session, row)
+            symbol = self.get_or_create_key(
                 session,
                 DimStock,
                 **row[self.get_model_column_names(DimStock, exclude_primary_key=False)],
@@ -166,9 +847,9 @@ class DBStockTarget(Database):
             low = row["low"]
             close = row["close"]
             stock_price = FtStockPrice(
-                symbol=stock.symbol,
-                time_id=time.time_id,
-                date_id=date.date_id,
+                symbol=symbol,
+                time_id=time_id,
+                date_id=date_id,
                 open=open,
                 high=high,
                 low=low,
@@ -177,11 +858,136 @@ class DBStockTarget(Database):
             if not self.does_row_exist(session, stock_price):
                 session.add(stock_price)
 
+    def _bulk_save_data(self, session: session, data: pd.DataFrame):
+        if self.smart_dimension_keys:
+            data = self.add_smart_dimension_keys(session, data)
+
+        columns = [
+            *self.get_date_time_columns(),
+            *self.get_model_column_names(DimStock, exclude_primary_key=False),
+            *self.VALUE_COLUMNS,
+        ]
+        staging = self.create_staging_table(
+            session, data.loc[:, columns], self.STAGING_TABLE
+        )
+        self.insert_missing_date_time_rows(session, staging)
+        self.insert_missing_dimension_rows(
+            session, DimStock, staging, ["symbol"], exclude_primary_key=False
+        )
+        self.insert_missing_fact_rows(
+            session, FtStockPrice, staging, "symbol", self.VALUE_COLUMNS
+        )
+        self.drop_staging_table(session, staging)
+
 
 class DBPredictionTarget(Database):
+    STAGING_TABLE = "stg_predictions_t"
+    REPLACE_MODES = ("truncate", "atomic", "changed")
+
+    def __init__(self, *args, replace_mode="truncate", **kwargs) -> None:
+        if replace_mode not in self.REPLACE_MODES:
+            raise ValueError(
+                f"Unknown replace mode {replace_mode}, expected one of {self.REPLACE_MODES}"
+            )
+        self.replace_mode = replace_mode
+        super().__init__(*args, **kwargs)
+
     def _save_data(self, session: session, data: pd.DataFrame):
+        if data.empty:
+            return self._keep_predictions()
+        if self.replace_mode == "atomic":
+            return self._replace_atomically(session, data)
+        if self.replace_mode == "changed":
+            return self._replace_changed_rows(session, [data])
+
         self.truncate_table(Predictions)
 
         for _, row in data.iterrows():
             prediction = Predictions(**row)
             session.add(prediction)
+
+    def _save_batches(self, session: session, batches: Iterable[pd.DataFrame]):
+        # The old predictions are only replaced once the first rows arrived.
+        batches = (batch for batch in batches if not batch.empty)
+        first_batch = next(batches, None)
+        if first_batch is None:
+            return self._keep_predictions()
+        batches = chain([first_batch], batches)
+
+        if self.replace_mode == "changed":
+            return self._replace_changed_rows(session, batches)
+
+        if self.replace_mode == "atomic":
+            session.execute(delete(Predictions))
+        else:
+            self.truncate_table(Predictions)
+        for batch in batches:
+            self._insert_predictions(session, batch)
+
+    def _save_chunk(self, session: session, data: pd.DataFrame, entities: list):
+        self._replace_atomically(session, data, entities)
+
+    def _keep_predictions(self):
+        logging.warning("No predictions were produced, the old predictions are kept")
+
+    def _finish_chunked_save(self, session: session, run_id: int):
+        # Predictions of entities that are not part of this run anymore.
+        is_run_entity = exists().where(
+            PipelineCheckpoint.run_id == run_id,
+            PipelineCheckpoint.entity == Predictions.entity,
+        )
+        session.execute(delete(Predictions).where(~is_run_entity))
+
+    def _replace_atomically(
+        self, session: session, data: pd.DataFrame, entities: Optional[list] = None
+    ):
+        """
+        Deletes the old predictions, only those of the given entities if any,
+        and bulk inserts the new ones in the save transaction, so readers
+        never see an empty table and a failure keeps the previous predictions.
+        """
+        statement = delete(Predictions)
+        if entities is not None:
+            statement = statement.where(Predictions.entity.in_(entities))
+        session.execute(statement)
+        self._insert_predictions(session, data)
+
+    def _insert_predictions(self, session: session, data: pd.DataFrame):
+        columns = self.get_model_column_names(Predictions, exclude_primary_key=False)
+        if not data.empty:
+            session.execute(insert(Predictions), data[list(columns)].to_dict("records"))
+
+    def _replace_changed_rows(self, session: session, batches: Iterable[pd.DataFrame]):
+        """
+        Stages the new predictions and writes only the difference: rows that
+        disappeared or whose value changed are deleted, then the missing rows
+        are inserted, all in the save transaction.
+        """
+        columns = self.get_model_column_names(Predictions, exclude_primary_key=False)
+        dtype = {col: Predictions.__table__.c[col].type for col in columns}
+        staging = None
+        for batch in batches:
+            staging = self.create_staging_table(
+                session,
+                batch[list(columns)],
+                self.STAGING_TABLE,
+                dtype=dtype,
+                if_exists="replace" if staging is None else "append",
+            )
+
+        is_unchanged_row = exists().where(
+            and_(*[getattr(Predictions, col) == staging.c[col] for col in columns])
+        )
+        session.execute(delete(Predictions).where(~is_unchanged_row))
+
+        primary_keys = self.get_model_column_names(Predictions, only_primary_keys=True)
+        is_existing_row = exists().where(
+            and_(*[getattr(Predictions, key) == staging.c[key] for key in primary_keys])
+        )
+        session.execute(
+            insert(Predictions).from_select(
+                columns,
+                select(*[staging.c[col] for col in columns]).where(~is_existing_row),
+            )
+        )
+        self.drop_staging_table(session, staging)
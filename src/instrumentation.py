@@ -0,0 +1,198 @@
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+import json
+import logging
+from threading import Lock, local
+from time import perf_counter
+import tracemalloc
+from typing import Callable, Optional
+
+
+class Instrumentation:
+    """
+    Collects wall time, peak memory and counters (HTTP calls and bytes, DB
+    round trips, rows written) per stage of a pipeline invocation. While it is
+    disabled, stages and counters return after a single attribute check.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.track_memory = False
+        self.exporters = []
+        self._lock = Lock()
+        self._local = local()
+        self.reset()
+
+    def configure(
+        self,
+        enabled: bool = False,
+        track_memory: bool = False,
+        json_lines_path: Optional[str] = None,
+    ):
+        self.enabled = enabled
+        self.track_memory = enabled and track_memory
+        self.exporters = [log_exporter]
+        if json_lines_path:
+            self.exporters.append(JsonLinesExporter(json_lines_path))
+
+    def add_exporter(self, exporter: Callable[[dict], None]):
+        self.exporters.append(exporter)
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.totals = {}
+
+    def _get_stack(self) -> list:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def stage(self, name: str):
+        if not self.enabled:
+            yield
+            return
+
+        stack = self._get_stack()
+        frame = {"name": name, "counters": {}, "peak_memory": 0}
+        if self.track_memory and tracemalloc.is_tracing():
+            # The parent keeps the peak reached so far, the peak is then reset
+            # to measure this stage alone.
+            if stack:
+                stack[-1]["peak_memory"] = max(
+                    stack[-1]["peak_memory"], tracemalloc.get_traced_memory()[1]
+                )
+            tracemalloc.reset_peak()
+        stack.append(frame)
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            seconds = perf_counter() - start
+            stack.pop()
+            if self.track_memory and tracemalloc.is_tracing():
+                frame["peak_memory"] = max(
+                    frame["peak_memory"], tracemalloc.get_traced_memory()[1]
+                )
+                if stack:
+                    stack[-1]["peak_memory"] = max(
+                        stack[-1]["peak_memory"], frame["peak_memory"]
+                    )
+            self._record_stage(frame, seconds)
+
+    def _record_stage(self, frame: dict, seconds: float):
+        with self._lock:
+            stage = self.stages.setdefault(
+                frame["name"], {"calls": 0, "seconds": 0.0, "peak_memory_mb": None}
+            )
+            stage["calls"] += 1
+            stage["seconds"] += seconds
+            if self.track_memory:
+                stage["peak_memory_mb"] = max(
+                    stage["peak_memory_mb"] or 0, frame["peak_memory"] / 2**20
+                )
+            for counter, value in frame["counters"].items():
+                stage[counter] = stage.get(counter, 0) + value
+
+    def count(self, counter: str, value: int = 1):
+        """
+        Adds the value to the counter of the innermost stage of the current
+        thread and to the invocation totals.
+        """
+        if not self.enabled:
+            return
+
+        stack = self._get_stack()
+        if stack:
+            counters = stack[-1]["counters"]
+            counters[counter] = counters.get(counter, 0) + value
+        with self._lock:
+            self.totals[counter] = self.totals.get(counter, 0) + value
+
+    @contextmanager
+    def invocation(self, name: str):
+        if not self.enabled:
+            yield
+            return
+
+        self.reset()
+        started_at = datetime.now()
+        start_tracing = self.track_memory and not tracemalloc.is_tracing()
+        if start_tracing:
+            tracemalloc.start()
+        start = perf_counter()
+        try:
+            with self.stage(name):
+                yield
+        finally:
+            seconds = perf_counter() - start
+            if start_tracing:
+                tracemalloc.stop()
+            self.export(
+                {
+                    "invocation": name,
+                    "started_at": started_at.isoformat(),
+                    "seconds": round(seconds, 3),
+                    "stages": self.stages,
+                    "totals": self.totals,
+                }
+            )
+
+    def export(self, summary: dict):
+        for exporter in self.exporters:
+            try:
+                exporter(summary)
+            except Exception as e:
+                logging.warning(f"Instrumentation exporter failed: {e}")
+
+
+def log_exporter(summary: dict):
+    logging.info(f"Instrumentation summary: {json.dumps(summary)}")
+
+
+class JsonLinesExporter:
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def __call__(self, summary: dict):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(summary) + "\n")
+
+
+INSTRUMENTATION = Instrumentation()
+
+
+def configure_instrumentation(**kwargs):
+    INSTRUMENTATION.configure(**kwargs)
+
+
+def stage(name: str):
+    return INSTRUMENTATION.stage(name)
+
+
+def count(counter: str, value: int = 1):
+    INSTRUMENTATION.count(counter, value)
+
+
+def invocation(name: str):
+    return INSTRUMENTATION.invocation(name)
+
+
+def instrumented(name: str):
+    """
+    Decorates a function so every call is recorded as the given stage.
+    """
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not INSTRUMENTATION.enabled:
+                return function(*args, **kwargs)
+            with INSTRUMENTATION.stage(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -1,11 +1,33 @@
+from typing import Optional
+
+import numpy as np
 import pandas as pd
-from sklearn.model_selection import train_test_split
 import lightgbm as lgb
 
+from src.instrumentation import instrumented
+from src.ml.model_store import ModelStore, rmse
+
 
 class Model(object):
-    def __init__(self, num_of_days_to_predict: int = 14) -> None:
+    def __init__(
+        self,
+        num_of_days_to_predict: int = 14,
+        num_threads: Optional[int] = None,
+        model_store: Optional[ModelStore] = None,
+        incremental_num_boost_round: int = 50,
+        incremental_window_size: int = 100,
+        early_stopping_rounds: Optional[int] = None,
+        validation_size: float = 0.2,
+        num_boost_round: int = 1000,
+    ) -> None:
         self.number_of_days_to_predict = num_of_days_to_predict
+        self.num_threads = num_threads
+        self.model_store = model_store
+        self.incremental_num_boost_round = incremental_num_boost_round
+        self.incremental_window_size = incremental_window_size
+        self.early_stopping_rounds = early_stopping_rounds
+        self.validation_size = validation_size
+        self.num_boost_round = num_boost_round
 
     def get_future_dates(self, df_containing_dates: pd.DataFrame):
         temp = pd.DataFrame()
@@ -40,31 +62,189 @@ class Model(object):
 
         return future_dates
 
-    def lightgbm(self, dataset: pd.DataFrame):
-        X = dataset.drop(columns=["price", "datetime"])
+    def get_params(self) -> dict:
+        params = {
+            "objective": "regression",
+            "metric": "rmse",
+            "verbosity": -1,
+        }
+        if self.num_threads:
+            params["num_threads"] = self.num_threads
+        return params
+
+    @instrumented("Model.lightgbm")
+    def lightgbm(self, dataset: pd.DataFrame, entity: Optional[str] = None):
+        X = dataset.drop(columns=["price", "datetime"], errors="ignore")
         y = dataset.loc[:, "price"]
+
+        if self.model_store is not None and entity is not None:
+            model = self.train_incrementally(X, y, entity)
+        else:
+            model = self.train(X, y)
+
+        future_dates = self.get_future_dates(X)
+
+        predictions = model.predict(future_dates)
+
+        # y_val_pred = model.predict(X_val)
+        # val_rmse = mean_squared_error(y_val, y_val_pred, squared=False)
+
+        return predictions, future_dates
+
+    @instrumented("Model.global_lightgbm")
+    def global_lightgbm(self, training_df: pd.DataFrame) -> list:
+        """
+        Trains one booster on every entity, with the entity as a categorical
+        feature and the price divided by the entity's mean price as the target,
+        then predicts all entities' horizons in a single predict call.
+        Returns (entity, predictions, future_dates) tuples in entity order.
+        """
+        X = training_df.drop(columns=["price", "datetime"], errors="ignore")
+        X["entity"] = X["entity"].astype("category")
+        mean_prices = training_df.groupby(X["entity"], observed=True)["price"].mean()
+        mean_prices = mean_prices.abs().replace(0, 1)
+        y = training_df["price"] / X["entity"].map(mean_prices).astype(float)
+
+        model = self.train(X, y)
+
+        entities = []
+        all_future_dates = []
+        for entity, entity_X in X.groupby("entity", sort=False, observed=True):
+            entities.append(entity)
+            all_future_dates.append(self.get_future_dates(entity_X))
+
+        future_X = pd.concat(all_future_dates, ignore_index=True)
+        future_X["entity"] = pd.Categorical(
+            np.repeat(entities, [len(dates) for dates in all_future_dates]),
+            categories=X["entity"].cat.categories,
+        )
+        predictions = (
+            model.predict(future_X[X.columns])
+            * future_X["entity"].map(mean_prices).astype(float).to_numpy()
+        )
+
+        bounds = np.cumsum([0] + [len(dates) for dates in all_future_dates])
+        return [
+            (entity, predictions[start:stop], future_dates)
+            for entity, future_dates, start, stop in zip(
+                entities, all_future_dates, bounds[:-1], bounds[1:]
+            )
+        ]
+
+    def train(self, X: pd.DataFrame, y: pd.Series) -> lgb.Booster:
+        if self.early_stopping_rounds:
+            return self.train_with_early_stopping(X, y)
+
+        from sklearn.model_selection import train_test_split
+
         TRAIN_SIZE = 0.8
 
         X_train, X_val, y_train, y_val = train_test_split(
             X, y, test_size=TRAIN_SIZE, random_state=42
         )
 
-        params = {
-            "objective": "regression",
-            "metric": "rmse",
-        }
-
         train_data = lgb.Dataset(X_train, label=y_train)
         val_data = lgb.Dataset(X_val, label=y_val)
 
+        return lgb.train(
+            self.get_params(),
+            train_data,
+            valid_sets=[train_data, val_data],
+            num_boost_round=self.num_boost_round,
+        )
+
+    def train_with_early_stopping(self, X: pd.DataFrame, y: pd.Series) -> lgb.Booster:
+        params = self.get_params()
+        chronological_order = np.lexsort((X["day"], X["month"], X["year"]))
+        X, y = X.iloc[chronological_order], y.iloc[chronological_order]
+        train_size = int(len(X) * (1 - self.validation_size))
+
+        if train_size < 1 or train_size == len(X):
+            return lgb.train(
+                params, lgb.Dataset(X, label=y), num_boost_round=self.num_boost_round
+            )
+
+        # The validation set is the most recent part of the history and is
+        # binned with the training set's bin boundaries.
+        train_data = lgb.Dataset(X.iloc[:train_size], label=y.iloc[:train_size])
+        val_data = lgb.Dataset(
+            X.iloc[train_size:], label=y.iloc[train_size:], reference=train_data
+        )
         model = lgb.train(
-            params, train_data, valid_sets=[train_data, val_data], num_boost_round=1000
+            params,
+            train_data,
+            valid_sets=[val_data],
+            num_boost_round=self.num_boost_round,
+            callbacks=[lgb.early_stopping(self.early_stopping_rounds, verbose=False)],
         )
-        future_dates = self.get_future_dates(X)
 
-        predictions = model.predict(future_dates)
+        # The forecast starts right after the held out days, so the booster is
+        # retrained on the whole history for the best number of rounds.
+        return lgb.train(
+            params,
+            lgb.Dataset(X, label=y),
+            num_boost_round=model.best_iteration or self.num_boost_round,
+        )
 
-        # y_val_pred = model.predict(X_val)
-        # val_rmse = mean_squared_error(y_val, y_val_pred, squared=False)
+    def train_incrementally(
+        self, X: pd.DataFrame, y: pd.Series, entity: str
+    ) -> lgb.Booster:
+        booster, metadata = self.model_store.load(entity)
+        dates = pd.to_datetime(X[["year", "month", "day"]])
+        if metadata:
+            is_new_row = dates > pd.Timestamp(metadata["last_trained_date"])
+        else:
+            is_new_row = pd.Series(True, index=X.index)
+        X_new, y_new = X[is_new_row], y[is_new_row]
+        # Error of the stored booster on rows it has not seen yet. The first
+        # value after a full retrain becomes the baseline for drift detection.
+        new_rows_rmse = (
+            rmse(booster, X_new, y_new) if booster and not X_new.empty else None
+        )
 
-        return predictions, future_dates
+        continued_booster = None
+        if not self.model_store.needs_full_retrain(metadata, new_rows_rmse):
+            continued_booster = (
+                self.continue_training(booster, X, y, dates, len(X_new))
+                if not X_new.empty
+                else booster
+            )
+
+        if continued_booster is None:
+            booster = self.train(X, y)
+            metadata = {"runs_since_full_retrain": 0, "baseline_rmse": None}
+        else:
+            booster = continued_booster
+            if metadata["baseline_rmse"] is None:
+                metadata["baseline_rmse"] = new_rows_rmse
+            metadata["runs_since_full_retrain"] += 1
+
+        metadata["last_trained_date"] = dates.max().isoformat()
+        self.model_store.save(entity, booster, metadata)
+        return booster
+
+    def continue_training(
+        self,
+        booster: lgb.Booster,
+        X: pd.DataFrame,
+        y: pd.Series,
+        dates: pd.Series,
+        num_of_new_rows: int,
+    ) -> Optional[lgb.Booster]:
+        """
+        Continues the booster on the most recent incremental_window_size rows,
+        which include the new ones. A week of new rows alone is too few for a
+        split with LightGBM's min_data_in_leaf. Returns None when no tree
+        could be added, as the new rows would then never be learned.
+        """
+        window_size = max(num_of_new_rows, self.incremental_window_size)
+        is_window_row = dates >= dates.nlargest(window_size).min()
+        continued_booster = lgb.train(
+            self.get_params(),
+            lgb.Dataset(X[is_window_row], label=y[is_window_row]),
+            num_boost_round=self.incremental_num_boost_round,
+            init_model=booster,
+        )
+        if continued_booster.num_trees() == booster.num_trees():
+            return None
+        return continued_booster
@@ -0,0 +1,67 @@
+import json
+import logging
+import os
+import re
+from typing import Optional
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+
+
+class ModelStore:
+    def __init__(
+        self,
+        path: str,
+        full_retrain_every_n_runs: int = 4,
+        drift_threshold: float = 1.5,
+    ) -> None:
+        self.path = path
+        self.full_retrain_every_n_runs = full_retrain_every_n_runs
+        self.drift_threshold = drift_threshold
+
+    def _get_paths(self, entity: str) -> tuple:
+        file_name = re.sub(r"[^\w.-]", "_", str(entity))
+        return (
+            os.path.join(self.path, f"{file_name}.txt"),
+            os.path.join(self.path, f"{file_name}.json"),
+        )
+
+    def load(self, entity: str) -> tuple:
+        model_path, metadata_path = self._get_paths(entity)
+        if not (os.path.exists(model_path) and os.path.exists(metadata_path)):
+            return None, None
+
+        with open(metadata_path) as f:
+            metadata = json.load(f)
+        return lgb.Booster(model_file=model_path), metadata
+
+    def save(self, entity: str, booster: lgb.Booster, metadata: dict):
+        model_path, metadata_path = self._get_paths(entity)
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            # Written by Python, so an unwritable path raises an OSError.
+            with open(model_path, "w") as f:
+                f.write(booster.model_to_string())
+            with open(metadata_path, "w") as f:
+                json.dump(metadata, f)
+        except OSError as e:
+            # The next run retrains the entity in full.
+            logging.warning(f"Failed to save the model of {entity}: {e}")
+
+    def needs_full_retrain(
+        self, metadata: Optional[dict], new_rows_rmse: Optional[float]
+    ) -> bool:
+        if metadata is None:
+            return True
+        if metadata["runs_since_full_retrain"] + 1 >= self.full_retrain_every_n_runs:
+            return True
+        if new_rows_rmse is None or metadata["baseline_rmse"] is None:
+            return False
+
+        baseline_rmse = max(metadata["baseline_rmse"], np.finfo(float).eps)
+        return new_rows_rmse > self.drift_threshold * baseline_rmse
+
+
+def rmse(booster: lgb.Booster, X: pd.DataFrame, y: pd.Series) -> float:
+    return float(np.sqrt(np.mean((booster.predict(X) - y.to_numpy()) ** 2)))
@@ -0,0 +1,102 @@
+from concurrent.futures import ProcessPoolExecutor
+from copy import copy
+import multiprocessing
+from multiprocessing.shared_memory import SharedMemory
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.ml.model import Model
+
+# The Functions worker runs gRPC and LightGBM threads, forking it can deadlock
+# a worker on a lock held by one of them.
+START_METHOD = (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+
+def get_worker_count(max_workers: int = 0) -> int:
+    """
+    Returns max_workers capped at the CPU count, or the CPU count when
+    max_workers is 0.
+    """
+    cpu_count = os.cpu_count() or 1
+    return min(max_workers, cpu_count) if max_workers > 0 else cpu_count
+
+
+def _train_entity_from_shared_memory(
+    model: Model,
+    entity: str,
+    shared_memory_name: str,
+    shape: tuple,
+    columns: list,
+    dtypes: dict,
+    start: int,
+    stop: int,
+):
+    shared_memory = SharedMemory(name=shared_memory_name)
+    try:
+        block = np.ndarray(shape, dtype=np.float64, buffer=shared_memory.buf)
+        dataset = pd.DataFrame(block[start:stop].copy(), columns=columns)
+    finally:
+        shared_memory.close()
+
+    return model.lightgbm(dataset.astype(dtypes), entity)
+
+
+def train_entities_in_parallel(
+    model: Model, training_df: pd.DataFrame, max_workers: int
+) -> list:
+    """
+    Trains one model per entity in a process pool. The numeric training
+    columns are copied once, grouped by entity, into a shared memory block and
+    every worker reads only its own row range from it.
+    Returns (entity, predictions, future_dates) tuples in entity order.
+    """
+    group_indices = training_df.groupby("entity", sort=False, observed=True).indices
+    entities = list(group_indices.keys())
+    columns = [col for col in training_df.columns if col not in ("entity", "datetime")]
+    dtypes = training_df[columns].dtypes.to_dict()
+    order = np.concatenate([group_indices[entity] for entity in entities])
+    shape = (len(order), len(columns))
+
+    worker_model = copy(model)
+    worker_model.num_threads = max(1, (os.cpu_count() or 1) // max_workers)
+
+    shared_memory = SharedMemory(
+        create=True, size=max(1, np.dtype(np.float64).itemsize * shape[0] * shape[1])
+    )
+    try:
+        block = np.ndarray(shape, dtype=np.float64, buffer=shared_memory.buf)
+        for position, col in enumerate(columns):
+            block[:, position] = training_df[col].to_numpy(dtype=np.float64)[order]
+
+        bounds = np.cumsum([0] + [len(group_indices[entity]) for entity in entities])
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context(START_METHOD),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _train_entity_from_shared_memory,
+                    worker_model,
+                    entity,
+                    shared_memory.name,
+                    shape,
+                    columns,
+                    dtypes,
+                    int(start),
+                    int(stop),
+                )
+                for entity, start, stop in zip(entities, bounds[:-1], bounds[1:])
+            ]
+            results = [future.result() for future in futures]
+    finally:
+        shared_memory.close()
+        shared_memory.unlink()
+
+    return [
+        (entity, predictions, future_dates)
+        for entity, (predictions, future_dates) in zip(entities, results)
+    ]
@@ -1,32 +1,31 @@
-import yaml
-
-from src.data_sources.sources import APISource
+from src.config import load_config
+from src.data_sources.sources import APISource, configure_http_session_pool
 from src.transformations.transformations import CoinrankingToDailyStockData
 from src.data_targets.targets import DBCoinTarget
 
 
 def run():
-    with open("database_config.yaml") as f:
-        yaml_dictionary = yaml.safe_load(f)
+    config = load_config()
+    configure_http_session_pool(**config.http)
+
+    COINRANKING_API_SOURCE = config.api_source("coinranking_daily_coin_data")
+    GENERAL = config.general
 
-    CONNECTION_STRING = (
-        yaml_dictionary.get("data_targets")
-        .get("databases")
-        .get("remote")
-        .get("azure_sql_server")
-        .get("connection_string")
-    )
-    COINRANKING_API_SOURCE = (
-        yaml_dictionary.get("data_sources")
-        .get("api_data_sources")
-        .get("coinranking_daily_coin_data")
-    )
-    MAX_RETRY_COUNT_ON_FAIL = (
-        yaml_dictionary.get("pipelines").get("general").get("max_retry_count_on_fail")
-    )
     coinranking_api_source = APISource(
         COINRANKING_API_SOURCE["url"], COINRANKING_API_SOURCE["method"]
     )
     coinranking_transformer = CoinrankingToDailyStockData(coinranking_api_source)
-    data_target = DBCoinTarget(CONNECTION_STRING, max_retries=MAX_RETRY_COUNT_ON_FAIL)
+    data_target = DBCoinTarget(
+        config.connection_string,
+        max_retries=GENERAL["max_retry_count_on_fail"],
+        bulk_load=GENERAL.get("bulk_load", False),
+        key_cache_size=GENERAL.get("dimension_key_cache_size", 0),
+        engine_options=config.engine,
+        chunk_size=GENERAL.get("chunk_size", 0),
+        resume_window_hours=GENERAL.get("resume_window_hours", 12),
+        batch_size=GENERAL.get("batch_size", 0),
+        smart_dimension_keys=GENERAL.get("smart_dimension_keys", False),
+        calendar_start_date=GENERAL.get("calendar_start_date", "2015-01-01"),
+        calendar_end_date=GENERAL.get("calendar_end_date", "2035-12-31"),
+    )
     data_target.save(coinranking_transformer)
@@ -1,6 +1,7 @@
-import yaml
-
+from src.config import get_local_path, load_config
+from src.data_sources.cache import WebTableCache
 from src.data_sources.sources import (
+    configure_http_session_pool,
     FinancialModellingPrepStockDataInfo,
     UrlWebScraper,
     FinnhubStockPrice,
@@ -10,35 +11,23 @@ from src.data_targets.targets import DBStockTarget
 
 
 def run():
-    with open("database_config.yaml") as f:
-        yaml_dictionary = yaml.safe_load(f)
+    config = load_config()
+    configure_http_session_pool(**config.http)
 
-    top_stocks_config = (
-        yaml_dictionary.get("data_sources")
-        .get("web_scraping_sources")
-        .get("stock_analysis_top_stocks")
-    )
-    stock_info_config = (
-        yaml_dictionary.get("data_sources")
-        .get("api_data_sources")
-        .get("financial_modeling_prep_stock_info")
-    )
-    stock_price_config = (
-        yaml_dictionary.get("data_sources")
-        .get("api_data_sources")
-        .get("finnhub_stock_price")
-    )
-    CONNECTION_STRING = (
-        yaml_dictionary.get("data_targets")
-        .get("databases")
-        .get("remote")
-        .get("azure_sql_server")
-        .get("connection_string")
-    )
-    MAX_RETRY_COUNT_ON_FAIL = (
-        yaml_dictionary.get("pipelines").get("general").get("max_retry_count_on_fail")
-    )
-    top_stocks_scraper = UrlWebScraper(top_stocks_config["url"])
+    top_stocks_config = config.web_scraping_source("stock_analysis_top_stocks")
+    stock_info_config = config.api_source("financial_modeling_prep_stock_info")
+    stock_price_config = config.api_source("finnhub_stock_price")
+    GENERAL = config.general
+    PIPELINE = config.pipeline("daily_stock_data")
+
+    WEB_TABLE_CACHE = config.web_table_cache
+    web_table_cache = None
+    if WEB_TABLE_CACHE.get("enabled", False):
+        web_table_cache = WebTableCache(
+            get_local_path(WEB_TABLE_CACHE["path"]), WEB_TABLE_CACHE["ttl_hours"]
+        )
+
+    top_stocks_scraper = UrlWebScraper(top_stocks_config["url"], cache=web_table_cache)
     stock_data_price_api = FinnhubStockPrice(
         url=stock_price_config["url"], params=stock_price_config["params"]
     )
@@ -46,10 +35,24 @@ def run():
         url=stock_info_config["url"], params=stock_info_config["params"]
     )
     stock_data_transformer = DailyStockData(
-        top_stocks_scraper, stock_data_info_api, stock_data_price_api
+        top_stocks_scraper,
+        stock_data_info_api,
+        stock_data_price_api,
+        PIPELINE.get("number_of_stock_to_get", 5),
+        PIPELINE.get("max_workers", 1),
     )
 
     stock_save_target = DBStockTarget(
-        CONNECTION_STRING, max_retries=MAX_RETRY_COUNT_ON_FAIL
+        config.connection_string,
+        max_retries=GENERAL["max_retry_count_on_fail"],
+        bulk_load=GENERAL.get("bulk_load", False),
+        key_cache_size=GENERAL.get("dimension_key_cache_size", 0),
+        engine_options=config.engine,
+        chunk_size=GENERAL.get("chunk_size", 0),
+        resume_window_hours=GENERAL.get("resume_window_hours", 12),
+        batch_size=GENERAL.get("batch_size", 0),
+        smart_dimension_keys=GENERAL.get("smart_dimension_keys", False),
+        calendar_start_date=GENERAL.get("calendar_start_date", "2015-01-01"),
+        calendar_end_date=GENERAL.get("calendar_end_date", "2035-12-31"),
     )
     stock_save_target.save(stock_data_transformer)
@@ -1,8 +1,10 @@
-import yaml
-
+from src.config import get_local_path, load_config
 from src.data_targets.targets import DBPredictionTarget
 from src.ml.model import Model
+from src.ml.model_store import ModelStore
+from src.data_sources.cache import PriceHistoryCache, WebTableCache
 from src.data_sources.sources import (
+    configure_http_session_pool,
     APISource,
     CoinrankingCoinPriceHistory,
     UrlWebScraper,
@@ -13,28 +15,29 @@ from src.transformations.transformations import (
     ModelTrainingData,
     PredictionsData,
     StockTrainingData,
+    WarehouseTrainingData,
 )
 
 
 def run():
-    with open("database_config.yaml") as f:
-        yaml_dictionary = yaml.safe_load(f)
+    config = load_config()
+    configure_http_session_pool(**config.http)
+
+    top_stocks_config = config.web_scraping_source("stock_analysis_top_stocks")
+    uuid_source_config = config.api_source("coinranking_coin_uuid")
+    stock_price_config = config.api_source("coinranking_coin_price_history")
+    PIPELINE = config.pipeline("ml_price_prediction")
+    CONNECTION_STRING = config.connection_string
+    MAX_RETRY_COUNT_ON_FAIL = config.general["max_retry_count_on_fail"]
+    PRICE_HISTORY_CACHE = config.price_history_cache
+
+    price_history_cache = None
+    if PRICE_HISTORY_CACHE.get("enabled", False):
+        price_history_cache = PriceHistoryCache(
+            get_local_path(PRICE_HISTORY_CACHE["path"]),
+            PRICE_HISTORY_CACHE["ttl_days"],
+        )
 
-    top_stocks_config = (
-        yaml_dictionary.get("data_sources")
-        .get("web_scraping_sources")
-        .get("stock_analysis_top_stocks")
-    )
-    uuid_source_config = (
-        yaml_dictionary.get("data_sources")
-        .get("api_data_sources")
-        .get("coinranking_coin_uuid")
-    )
-    stock_price_config = (
-        yaml_dictionary.get("data_sources")
-        .get("api_data_sources")
-        .get("coinranking_coin_price_history")
-    )
     uuid_source = APISource(
         uuid_source_config["url"],
         uuid_source_config["method"],
@@ -46,38 +49,88 @@ def run():
         stock_price_config["method"],
         stock_price_config["headers"],
         stock_price_config["params"],
-    )
-    PIPELINE = yaml_dictionary.get("pipelines").get("ml_price_prediction")
-    CONNECTION_STRING = (
-        yaml_dictionary.get("data_targets")
-        .get("databases")
-        .get("remote")
-        .get("azure_sql_server")
-        .get("connection_string")
-    )
-    MAX_RETRY_COUNT_ON_FAIL = (
-        yaml_dictionary.get("pipelines").get("general").get("max_retry_count_on_fail")
+        cache=price_history_cache,
     )
 
-    top_stocks_scraper = UrlWebScraper(top_stocks_config["url"])
-    stock_price_history = YahooStockPriceHistory()
+    WEB_TABLE_CACHE = config.web_table_cache
+    web_table_cache = None
+    if WEB_TABLE_CACHE.get("enabled", False):
+        web_table_cache = WebTableCache(
+            get_local_path(WEB_TABLE_CACHE["path"]), WEB_TABLE_CACHE["ttl_hours"]
+        )
+
+    top_stocks_scraper = UrlWebScraper(top_stocks_config["url"], cache=web_table_cache)
+    stock_price_history = YahooStockPriceHistory(
+        price_history_cache, PIPELINE.get("stock_download_batch_size", 0)
+    )
 
     stock_transformer = StockTrainingData(
         top_stocks_scraper,
         stock_price_history,
         PIPELINE["past_number_of_years_stock_price_history"],
         PIPELINE["number_of_stock_to_get"],
+        compact_dtypes=PIPELINE.get("compact_dtypes", False),
+        float32_price=PIPELINE.get("float32_price", False),
     )
     coin_transformer = CoinTrainingData(
         uuid_source,
         coin_price_history,
         PIPELINE["past_number_of_years_coin_price_history"],
         PIPELINE["number_of_coin_to_get"],
+        PIPELINE.get("max_concurrent_requests", 1),
+        PIPELINE.get("request_timeout"),
+        compact_dtypes=PIPELINE.get("compact_dtypes", False),
+        float32_price=PIPELINE.get("float32_price", False),
     )
     training_data_transformer = ModelTrainingData(stock_transformer, coin_transformer)
 
-    model = Model(PIPELINE["number_of_days_to_predict"])
-    prediction_transformer = PredictionsData(training_data_transformer, model)
+    target = DBPredictionTarget(
+        CONNECTION_STRING,
+        max_retries=MAX_RETRY_COUNT_ON_FAIL,
+        engine_options=config.engine,
+        chunk_size=config.general.get("chunk_size", 0),
+        resume_window_hours=config.general.get("resume_window_hours", 12),
+        batch_size=config.general.get("batch_size", 0),
+        replace_mode=PIPELINE.get("predictions_replace_mode", "truncate"),
+    )
+
+    if PIPELINE.get("training_source", "external") == "warehouse":
+        WAREHOUSE = PIPELINE.get("warehouse", {})
+        training_data_transformer = WarehouseTrainingData(
+            target.engine,
+            training_data_transformer,
+            max(
+                PIPELINE["past_number_of_years_stock_price_history"],
+                PIPELINE["past_number_of_years_coin_price_history"],
+            ),
+            WAREHOUSE.get("max_gap_days", 7),
+            WAREHOUSE.get("chunksize", 50_000),
+        )
+
+    INCREMENTAL_TRAINING = PIPELINE.get("incremental_training", {})
+    model_store = None
+    if INCREMENTAL_TRAINING.get("enabled", False):
+        model_store = ModelStore(
+            get_local_path(INCREMENTAL_TRAINING["model_store_path"]),
+            INCREMENTAL_TRAINING["full_retrain_every_n_runs"],
+            INCREMENTAL_TRAINING["drift_threshold"],
+        )
+    LIGHTGBM = PIPELINE.get("lightgbm", {})
+    model = Model(
+        PIPELINE["number_of_days_to_predict"],
+        num_threads=LIGHTGBM.get("num_threads") or None,
+        model_store=model_store,
+        incremental_num_boost_round=INCREMENTAL_TRAINING.get("num_boost_round", 50),
+        incremental_window_size=INCREMENTAL_TRAINING.get("window_size", 100),
+        early_stopping_rounds=LIGHTGBM.get("early_stopping_rounds"),
+        validation_size=LIGHTGBM.get("validation_size", 0.2),
+        num_boost_round=LIGHTGBM.get("num_boost_round", 1000),
+    )
+    prediction_transformer = PredictionsData(
+        training_data_transformer,
+        model,
+        PIPELINE.get("training_workers", 1),
+        global_model=PIPELINE.get("global_model", False),
+    )
 
-    target = DBPredictionTarget(CONNECTION_STRING, max_retries=MAX_RETRY_COUNT_ON_FAIL)
     target.save(prediction_transformer)
@@ -0,0 +1,106 @@
+import importlib
+import subprocess
+import sys
+from time import perf_counter
+from types import ModuleType
+
+HEAVY_MODULES = (
+    "pandas",
+    "numpy",
+    "sqlalchemy",
+    "requests",
+    "yfinance",
+    "lxml",
+    "sklearn",
+    "lightgbm",
+    "pyarrow",
+)
+
+PROCESS_STARTED_AT = perf_counter()
+IMPORT_TIMES = {}
+
+
+class LazyModule(ModuleType):
+    """
+    Stands in for a heavy dependency and imports it on first attribute access,
+    so importing a module that may use it does not pay the import cost.
+    """
+
+    def __init__(self, module_name: str) -> None:
+        super().__init__(module_name)
+        self._module = None
+
+    def __getattr__(self, attribute: str):
+        if self._module is None:
+            self._module = import_timed(self.__name__)
+        return getattr(self._module, attribute)
+
+
+def lazy_import(module_name: str) -> ModuleType:
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    return LazyModule(module_name)
+
+
+def import_timed(module_name: str) -> ModuleType:
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+
+    start = perf_counter()
+    module = importlib.import_module(module_name)
+    IMPORT_TIMES[module_name] = perf_counter() - start
+    return module
+
+
+def get_startup_report() -> dict:
+    return {
+        "seconds_since_process_start": round(perf_counter() - PROCESS_STARTED_AT, 3),
+        "import_seconds": {
+            module_name: round(seconds, 3)
+            for module_name, seconds in IMPORT_TIMES.items()
+        },
+        "loaded_heavy_modules": [
+            module_name for module_name in HEAVY_MODULES if module_name in sys.modules
+        ],
+    }
+
+
+def get_import_time_breakdown(module_name: str) -> dict:
+    """
+    Imports the module in a fresh interpreter with -X importtime and returns
+    the cumulative import time of every top-level package, in seconds. Time
+    spent importing a package from inside another one is attributed to the
+    imported package.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        depth = len(parts[2]) - len(parts[2].lstrip(" "))
+        imports.append((depth, parts[2].strip().split(".")[0], int(parts[1])))
+
+    # -X importtime reports children before their parent, so walking the lines
+    # backwards visits every parent before its children.
+    breakdown = {}
+    parent_packages = {}
+    for depth, package, cumulative in reversed(imports):
+        parent_packages[depth] = package
+        if parent_packages.get(depth - 2) != package:
+            breakdown[package] = breakdown.get(package, 0) + cumulative / 1e6
+
+    return dict(sorted(breakdown.items(), key=lambda item: item[1], reverse=True))
+
+
+if __name__ == "__main__":
+    for module_name in sys.argv[1:]:
+        print(module_name)
+        for package, seconds in get_import_time_breakdown(module_name).items():
+            if seconds >= 0.001:
+                print(f"  {package:<30} {seconds:8.3f}s")
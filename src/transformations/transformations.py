@@ -1,10 +1,15 @@
 from abc import ABC, abstractmethod
-from typing import Optional
-from datetime import datetime
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+from typing import Optional, AsyncIterator, Iterable, Iterator, TYPE_CHECKING
+from datetime import date, datetime
 from pytz import timezone
 import pandas as pd
+from pandas.api.types import union_categoricals
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import Engine, select, union_all, func
 
-from src.ml.model import Model
 from src.data_sources.sources import (
     APISource,
     CoinrankingCoinPriceHistory,
@@ -13,9 +18,19 @@ from src.data_sources.sources import (
     UrlWebScraper,
     YahooStockPriceHistory,
 )
+from src.data_targets.db_orm import DimDate, FtCoinPrice, FtStockPrice
+from src.instrumentation import instrumented
+
+if TYPE_CHECKING:
+    from src.ml.model import Model
 
 
 class Transformer(ABC):
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        if "transform" in cls.__dict__:
+            cls.transform = instrumented(f"{cls.__name__}.transform")(cls.transform)
+
     def __init__(self) -> None:
         self.processed_data = None
 
@@ -23,6 +38,98 @@ class Transformer(ABC):
     def transform(self) -> pd.DataFrame:
         pass
 
+    def iter_batches(self, batch_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        """
+        Yields the transformed data in batches of about batch_size rows, or all
+        of it at once without a batch size. This default slices the result of
+        transform(); transformers that can produce their data incrementally
+        override it so that only the current batch is held in memory.
+        """
+        data = self.transform()
+        if not batch_size:
+            yield data
+            return
+
+        for start in range(0, len(data), batch_size):
+            yield data.iloc[start : start + batch_size]
+
+    def get_entities(self) -> Optional[list]:
+        """
+        Entities that can be transformed independently with transform_entities,
+        or None when the transformer can only transform everything at once.
+        """
+        return None
+
+    def transform_entities(self, entities: list) -> pd.DataFrame:
+        raise NotImplementedError(
+            f"{type(self).__name__} can not transform a subset of its entities"
+        )
+
+
+def batch_frames(
+    frames: Iterable[pd.DataFrame], batch_size: Optional[int] = None
+) -> Iterator[pd.DataFrame]:
+    """
+    Concatenates consecutive frames until they hold at least batch_size rows,
+    so a frame, e.g. the history of one entity, is never split across batches.
+    """
+    batch = []
+    batch_rows = 0
+    for frame in frames:
+        batch.append(frame)
+        batch_rows += len(frame)
+        if batch_size and batch_rows >= batch_size:
+            yield concat_training_frames(batch)
+            batch = []
+            batch_rows = 0
+
+    if batch:
+        yield concat_training_frames(batch)
+
+
+def compact_training_frame(
+    data: pd.DataFrame, float32_price: bool = False
+) -> pd.DataFrame:
+    """
+    Converts a training frame in place to compact dtypes: categorical entity,
+    int16 year, int8 month and day, and optionally float32 price.
+    """
+    data["entity"] = data["entity"].astype("category")
+    data["year"] = data["year"].astype("int16")
+    data["month"] = data["month"].astype("int8")
+    data["day"] = data["day"].astype("int8")
+    if float32_price:
+        data["price"] = data["price"].astype("float32")
+    return data
+
+
+def concat_training_frames(frames: list) -> pd.DataFrame:
+    """
+    Concatenates training frames. Categorical entity columns are given the
+    union of all categories first, so the result stays categorical.
+    """
+    entities = [frame["entity"] for frame in frames if "entity" in frame]
+    if frames and len(entities) == len(frames):
+        if all(isinstance(entity.dtype, pd.CategoricalDtype) for entity in entities):
+            categories = union_categoricals(entities).categories
+            for frame in frames:
+                frame["entity"] = frame["entity"].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
+
+
+def log_memory_usage(stage: str, data: pd.DataFrame):
+    size_mb = data.memory_usage(deep=True).sum() / 2**20
+    logging.info(f"{stage}: {len(data)} rows, {size_mb:.1f} MB")
+
+
+def fill_missing_datetimes(datetime_value: pd.Series, now: datetime) -> pd.Series:
+    values = pd.to_datetime(datetime_value)
+    if values.dt.tz is None:
+        now = pd.Timestamp(now).tz_localize(None)
+    else:
+        now = pd.Timestamp(now).tz_convert(values.dt.tz)
+    return values.mask(values.isna(), now)
+
 
 class Date:
     def __init__(self):
@@ -48,11 +155,18 @@ class Date:
         self, datetime_value: Optional[datetime | pd.Series] = None
     ) -> pd.DataFrame:
         if isinstance(datetime_value, pd.Series):
-            date_dict_list = []
-            for value in datetime_value:
-                now = value if datetime_value.notnull().any() else self.now
-                date_dict_list.append(self._create_date_dict(now))
-            return pd.DataFrame(date_dict_list)
+            values = fill_missing_datetimes(datetime_value, self.now)
+            return pd.DataFrame(
+                {
+                    "date": values.dt.date,
+                    "day": values.dt.day,
+                    "week": values.dt.isocalendar().week.astype("int64"),
+                    "month": values.dt.month,
+                    "quarter": values.dt.quarter,
+                    "year": values.dt.year,
+                },
+                index=datetime_value.index,
+            )
 
         now = datetime_value or self.now
         return pd.DataFrame([self._create_date_dict(now)], index=[0])
@@ -84,11 +198,16 @@ class Time:
         self, datetime_value: Optional[datetime | pd.Series] = None
     ) -> pd.DataFrame:
         if isinstance(datetime_value, pd.Series):
-            time_dict_list = []
-            for value in datetime_value:
-                now = value if datetime_value.notnull().any() else self.now
-                time_dict_list.append(self._create_time_dict(now))
-            return pd.DataFrame(time_dict_list)
+            values = fill_missing_datetimes(datetime_value, self.now)
+            return pd.DataFrame(
+                {
+                    "time": values.dt.time,
+                    "hour": values.dt.hour,
+                    "minute": values.dt.minute,
+                    "second": values.dt.second,
+                },
+                index=datetime_value.index,
+            )
 
         now = datetime_value or self.now
         return pd.DataFrame([self._create_time_dict(now)])
@@ -139,6 +258,15 @@ class CoinrankingToDailyStockData(Transformer):
         self.processed_data = self.date.merge_with_date(df_with_time)
         return self.processed_data
 
+    def get_entities(self) -> list:
+        return list(self.clean_coin_data()["uuid"])
+
+    def transform_entities(self, entities: list) -> pd.DataFrame:
+        data = self.clean_coin_data()
+        data = data[data["uuid"].isin(entities)].reset_index(drop=True)
+        df_with_time = self.time.merge_with_time(data)
+        return self.date.merge_with_date(df_with_time)
+
 
 class DailyStockData(Transformer):
     def __init__(
@@ -147,43 +275,39 @@ class DailyStockData(Transformer):
         stock_data_info: FinancialModellingPrepStockDataInfo,
         stock_price: FinnhubStockPrice,
         num_of_stock_to_get: int = 5,
+        max_workers: int = 1,
     ) -> None:
         super().__init__()
         self.url_web_scraper = url_web_scraper
         self.stock_data_info = stock_data_info
         self.stock_price = stock_price
         self.NUM_OF_STOCK_TO_GET = num_of_stock_to_get
+        self.max_workers = max_workers
         self.time = Time()
         self.date = Date()
 
     def transform(self) -> pd.DataFrame:
         self.stock_symbols = self.clean_top_stocks()
-        stocks_df_all = self.get_stock_data(self.stock_symbols)
+        self.processed_data = self.transform_entities(self.stock_symbols)
+        return self.processed_data
+
+    def get_entities(self) -> list:
+        self.stock_symbols = self.clean_top_stocks()
+        return list(self.stock_symbols)
+
+    def transform_entities(self, entities: list) -> pd.DataFrame:
+        stocks_df_all = self.get_stock_data(entities)
+        if stocks_df_all.empty:
+            return stocks_df_all
         stocks_df = self.clean_stock_data(stocks_df_all)
         stocks_df = self.time.merge_with_time(stocks_df)
-        self.processed_data = self.date.merge_with_date(stocks_df)
-        return self.processed_data
+        return self.date.merge_with_date(stocks_df)
 
     def clean_top_stocks(self) -> list:
         top_stocks = self.url_web_scraper.get_data()
 
-        top_stocks.drop(columns="No.", inplace=True)
-        top_stocks["% Change"] = pd.to_numeric(
-            top_stocks["% Change"].str.rstrip("%"), errors="coerce"
-        ).fillna(0)
-
-        top_stocks = top_stocks.map(
-            lambda x: x.replace(",", "") if isinstance(x, str) else x
-        )
-
-        for col in ["Market Cap", "Revenue"]:
-            top_stocks[col] = top_stocks[col].str.rstrip("B")
-
-        top_stocks["Revenue"] = top_stocks["Revenue"].replace("-", "0")
-        top_stocks.loc[top_stocks["Revenue"].str.endswith("M"), "Revenue"] = "39.48"
-
-        float_columns = ["Market Cap", "Stock Price", "Revenue"]
-        top_stocks[float_columns] = top_stocks[float_columns].astype(float)
+        top_stocks = top_stocks.drop(columns="No.")
+        top_stocks["% Change"] = top_stocks["% Change"].fillna(0)
 
         top_stocks = top_stocks.sort_values(by="Market Cap", ascending=False)
         stock_symbols = top_stocks["Symbol"].head(self.NUM_OF_STOCK_TO_GET)
@@ -191,6 +315,9 @@ class DailyStockData(Transformer):
         return stock_symbols
 
     def get_stock_data(self, symbols):
+        if self.max_workers > 1:
+            return self.get_stock_data_concurrently(symbols)
+
         data = []
         for symbol in symbols:
             stock_info_dict = self.stock_data_info.get_data(symbol)
@@ -201,6 +328,21 @@ class DailyStockData(Transformer):
 
         return pd.DataFrame.from_dict(data)
 
+    def get_stock_data_concurrently(self, symbols):
+        symbols = list(symbols)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            stock_info_dicts = executor.map(self.stock_data_info.get_data, symbols)
+            stock_price_dicts = executor.map(self.stock_price.get_data, symbols)
+            data = [
+                {**stock_info_dict, **stock_price_dict}
+                for stock_info_dict, stock_price_dict in zip(
+                    stock_info_dicts, stock_price_dicts
+                )
+                if stock_info_dict and stock_price_dict
+            ]
+
+        return pd.DataFrame.from_dict(data)
+
     def clean_stock_data(self, df: pd.DataFrame):
         COLUMN_MAPPING = {
             "symbol": "symbol",
@@ -226,73 +368,194 @@ class StockTrainingData(Transformer):
         stock_history_source: YahooStockPriceHistory,
         past_num_of_years: int = 1,
         num_of_stock: int = 5,
+        compact_dtypes: bool = False,
+        float32_price: bool = False,
     ) -> None:
         super().__init__()
         self.url_web_scraper = url_web_scraper
         self.stock_history_source = stock_history_source
         self.past_num_of_years = past_num_of_years
         self.num_of_stock = num_of_stock
+        self.compact_dtypes = compact_dtypes
+        self.float32_price = float32_price
+
+    # Upper bound of the daily rows of one stock per year of history.
+    ROWS_PER_YEAR = 366
 
     def transform(self) -> pd.DataFrame:
-        top_stocks = self.url_web_scraper.get_data().loc[:, "Symbol"]
-        top_stocks = top_stocks[0 : self.num_of_stock]
+        top_stocks = self.get_top_stocks()
         raw_stock_data = self.stock_history_source.get_data(
             top_stocks, self.past_num_of_years
         )
         self.processed_data = self.clean_stock_data(raw_stock_data)
+        log_memory_usage("Stock training data", self.processed_data)
         return self.processed_data
 
+    def iter_batches(self, batch_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        if not batch_size:
+            yield self.transform()
+            return
+
+        top_stocks = list(self.get_top_stocks())
+        stocks_per_batch = max(
+            1, batch_size // (self.ROWS_PER_YEAR * self.past_num_of_years)
+        )
+        for start in range(0, len(top_stocks), stocks_per_batch):
+            raw_stock_data = self.stock_history_source.get_data(
+                top_stocks[start : start + stocks_per_batch], self.past_num_of_years
+            )
+            if not raw_stock_data.empty:
+                yield self.clean_stock_data(raw_stock_data)
+
+    def get_entities(self) -> list:
+        return list(self.get_top_stocks())
+
+    def transform_entities(
+        self, entities: list, since: Optional[date] = None
+    ) -> pd.DataFrame:
+        raw_stock_data = self.stock_history_source.get_data(
+            list(entities), self.past_num_of_years, since
+        )
+        if raw_stock_data.empty:
+            return pd.DataFrame(columns=CoinTrainingData.COLUMNS)
+        return self.clean_stock_data(raw_stock_data)
+
+    def get_top_stocks(self) -> pd.Series:
+        top_stocks = self.url_web_scraper.get_data().loc[:, "Symbol"]
+        return top_stocks[0 : self.num_of_stock]
+
     def clean_stock_data(self, stock_dataset: pd.DataFrame) -> pd.DataFrame:
         COLUMN_MAPPING = {"Close": "price", "symbol": "entity", "Date": "datetime"}
-        stock_dataset = stock_dataset.tz_localize(None)
-        stock_dataset = stock_dataset.reset_index()
+        stock_dataset = stock_dataset.tz_localize(None).reset_index()
         stock_dataset = stock_dataset.loc[:, COLUMN_MAPPING.keys()]
         stock_dataset.rename(columns=COLUMN_MAPPING, inplace=True)
         stock_dataset["year"] = stock_dataset["datetime"].dt.year
         stock_dataset["month"] = stock_dataset["datetime"].dt.month
         stock_dataset["day"] = stock_dataset["datetime"].dt.day
+        if self.compact_dtypes:
+            compact_training_frame(stock_dataset, self.float32_price)
         return stock_dataset
 
 
 class CoinTrainingData(Transformer):
+    COLUMNS = ["datetime", "price", "entity", "year", "month", "day"]
+
     def __init__(
         self,
         coin_uuid_source: APISource,
         coin_price_source: CoinrankingCoinPriceHistory,
         past_num_of_years: int = 1,
         num_of_coin: int = 5,
+        max_concurrent_requests: int = 1,
+        request_timeout: Optional[float] = None,
+        compact_dtypes: bool = False,
+        float32_price: bool = False,
     ) -> None:
         super().__init__()
         self.coin_uuid_source = coin_uuid_source
         self.coin_price_source = coin_price_source
         self.past_num_of_years = past_num_of_years
         self.num_of_coin = num_of_coin
+        self.max_concurrent_requests = max_concurrent_requests
+        self.request_timeout = request_timeout
+        self.compact_dtypes = compact_dtypes
+        self.float32_price = float32_price
 
     def transform(self) -> pd.DataFrame:
         raw_uuids = self.coin_uuid_source.get_data()
         uuids = self.clean_uuids(raw_uuids)
         self.processed_data = self.get_coin_price_history(uuids)
+        log_memory_usage("Coin training data", self.processed_data)
         return self.processed_data
 
+    def get_entities(self) -> list:
+        return self.clean_uuids(self.coin_uuid_source.get_data())
+
+    def transform_entities(
+        self, entities: list, since: Optional[date] = None
+    ) -> pd.DataFrame:
+        return self.get_coin_price_history(list(entities), since)
+
     def clean_uuids(self, uuids_dict: dict) -> list:
         coin_data = uuids_dict["data"]["coins"]
         coin_uuids = [coin["uuid"] for coin in coin_data]
         return coin_uuids
 
-    def get_coin_price_history(self, uuids: list):
-        coin_dataset = []
+    def iter_batches(self, batch_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        if not batch_size:
+            yield self.transform()
+            return
+
+        uuids = self.clean_uuids(self.coin_uuid_source.get_data())
+        for coin_dataset in batch_frames(
+            self.iter_coin_price_history(uuids), batch_size
+        ):
+            yield self.set_daily_datetimes(coin_dataset)
 
-        for uuid in uuids:
-            data = self.coin_price_source.get_data(uuid)
-            coin_df = self.clean_coin_data(data, uuid)
-            coin_dataset.append(coin_df)
+    def get_coin_price_history(self, uuids: list, since: Optional[date] = None):
+        if self.max_concurrent_requests > 1:
+            coin_dataset = asyncio.run(self.get_coin_price_history_async(uuids, since))
+        else:
+            coin_dataset = list(self.iter_coin_price_history(uuids, since))
 
-        coin_dataset = pd.concat(coin_dataset)
+        if not coin_dataset:
+            logging.warning("No coin price history received")
+            return pd.DataFrame(columns=self.COLUMNS)
+
+        coin_dataset = concat_training_frames(coin_dataset)
+        return self.set_daily_datetimes(coin_dataset)
+
+    def set_daily_datetimes(self, coin_dataset: pd.DataFrame) -> pd.DataFrame:
         coin_dataset["datetime"] = pd.to_datetime(
             coin_dataset[["year", "month", "day"]]
         )
         return coin_dataset
 
+    def iter_coin_price_history(
+        self, uuids: list, since: Optional[date] = None
+    ) -> Iterator[pd.DataFrame]:
+        if self.max_concurrent_requests <= 1:
+            for uuid in uuids:
+                data = self.coin_price_source.get_data(uuid, since)
+                if not data:
+                    logging.warning(f"No price history received for coin {uuid}")
+                    continue
+                yield self.clean_coin_data(data, uuid)
+            return
+
+        # Drives the async iterator from this generator, so the coin frames are
+        # handed over as their requests complete.
+        loop = asyncio.new_event_loop()
+        coin_dfs = self.iter_coin_price_history_async(uuids, since)
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(anext(coin_dfs))
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(coin_dfs.aclose())
+            loop.close()
+
+    async def get_coin_price_history_async(
+        self, uuids: list, since: Optional[date] = None
+    ) -> list:
+        return [
+            coin_df
+            async for coin_df in self.iter_coin_price_history_async(uuids, since)
+        ]
+
+    async def iter_coin_price_history_async(
+        self, uuids: list, since: Optional[date] = None
+    ) -> AsyncIterator[pd.DataFrame]:
+        async for uuid, data in self.coin_price_source.iter_data_async(
+            uuids, self.max_concurrent_requests, self.request_timeout, (since,)
+        ):
+            if not data:
+                logging.warning(f"No price history received for coin {uuid}")
+                continue
+            yield self.clean_coin_data(data, uuid)
+
     def clean_coin_data(self, data: dict, uuid: str) -> pd.DataFrame:
         df = pd.DataFrame.from_dict(data["data"]["history"])
         df["timestamp"] = df["timestamp"].apply(lambda x: datetime.fromtimestamp(x))
@@ -303,6 +566,8 @@ class CoinTrainingData(Transformer):
         df["year"] = df["datetime"].dt.year
         df["month"] = df["datetime"].dt.month
         df["day"] = df["datetime"].dt.day
+        if self.compact_dtypes:
+            compact_training_frame(df, self.float32_price)
         return df
 
 
@@ -315,38 +580,351 @@ class ModelTrainingData(Transformer):
         self.coin_transformer = coin_transformer
 
     def transform(self) -> pd.DataFrame:
-        coin_dataset = self.coin_transformer.transform()
-        stock_dataset = self.stock_transformer.transform()
-        self.processed_data = pd.concat(
-            [coin_dataset, stock_dataset], ignore_index=True
-        )
-        self.processed_data.dropna(inplace=True)
+        datasets = [
+            self.coin_transformer.transform(),
+            self.stock_transformer.transform(),
+        ]
+        # Rows with missing values are dropped per dataset, so the concatenated
+        # frame is not copied again.
+        datasets = [
+            dataset.dropna() if dataset.isna().any(axis=None) else dataset
+            for dataset in datasets
+        ]
+        self.processed_data = concat_training_frames(datasets)
+        log_memory_usage("Model training data", self.processed_data)
         return self.processed_data
 
+    def iter_batches(self, batch_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        for transformer in (self.coin_transformer, self.stock_transformer):
+            for batch in transformer.iter_batches(batch_size):
+                batch = batch.dropna()
+                if not batch.empty:
+                    yield batch
+
+    def get_entities(self) -> list:
+        self.entity_transformers = {}
+        for transformer in (self.coin_transformer, self.stock_transformer):
+            for entity in transformer.get_entities():
+                self.entity_transformers.setdefault(entity, transformer)
+        return list(self.entity_transformers)
+
+    def transform_entities(
+        self, entities: list, since: Optional[date] = None
+    ) -> pd.DataFrame:
+        """
+        Downloads the history of the entities, only from since when it is
+        given, e.g. to fill a gap in the warehouse history.
+        """
+        datasets = []
+        for transformer in (self.coin_transformer, self.stock_transformer):
+            transformer_entities = [
+                entity
+                for entity in entities
+                if self.entity_transformers.get(entity) is transformer
+            ]
+            if transformer_entities:
+                dataset = transformer.transform_entities(transformer_entities, since)
+                if not dataset.empty:
+                    datasets.append(dataset.dropna())
+
+        if not datasets:
+            return pd.DataFrame(columns=CoinTrainingData.COLUMNS)
+        return concat_training_frames(datasets)
+
+
+class WarehouseTrainingData(Transformer):
+    """
+    Reads the training data from the fact tables. Entities whose warehouse
+    history has a gap are downloaded from the fallback transformer, a
+    ModelTrainingData, StockTrainingData or CoinTrainingData, from the start
+    of the gap.
+    """
+
+    COLUMNS = ["datetime", "price", "entity", "year", "month", "day"]
+
+    def __init__(
+        self,
+        engine: Engine,
+        fallback_transformer: Optional[Transformer] = None,
+        past_num_of_years: int = 1,
+        max_gap_days: int = 7,
+        chunksize: int = 50_000,
+    ) -> None:
+        super().__init__()
+        self.engine = engine
+        self.fallback_transformer = fallback_transformer
+        self.past_num_of_years = past_num_of_years
+        self.max_gap_days = max_gap_days
+        self.chunksize = chunksize
+
+    def transform(self) -> pd.DataFrame:
+        histories = list(self.iter_entity_histories())
+        if not histories:
+            self.processed_data = pd.DataFrame(columns=self.COLUMNS)
+        else:
+            self.processed_data = pd.concat(histories, ignore_index=True)
+        return self.processed_data
+
+    def iter_batches(self, batch_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        if not batch_size:
+            yield self.transform()
+            return
+
+        yield from batch_frames(self.iter_entity_histories(), batch_size)
+
+    def iter_entity_histories(self) -> Iterator[pd.DataFrame]:
+        """
+        Yields the history of one entity at a time. Complete warehouse
+        histories are yielded while the query is read, the histories with gaps
+        are held until their missing ranges are downloaded at the end.
+        """
+        start_date = datetime.now().date() - relativedelta(years=self.past_num_of_years)
+        expected_entities = None
+        if self.fallback_transformer is not None:
+            expected_entities = self.fallback_transformer.get_entities()
+        expected_entity_set = set(expected_entities or [])
+
+        read_entities = set()
+        gap_histories = {}
+        gap_starts = {}
+        for history in self.iter_warehouse_histories(start_date):
+            entity = history["entity"].iloc[0]
+            # The same entities as the external sources train, so entities
+            # that left the top list are not trained from stale history.
+            if expected_entities is not None and entity not in expected_entity_set:
+                continue
+            read_entities.add(entity)
+            gap_start = self.get_gap_start(history, start_date)
+            if gap_start is None:
+                yield history
+            else:
+                gap_histories[entity] = history
+                gap_starts[entity] = gap_start
+
+        if self.fallback_transformer is None:
+            yield from gap_histories.values()
+            return
+
+        if expected_entities is None:
+            # The fallback can only transform all of its entities.
+            if gap_histories or not read_entities:
+                logging.info(
+                    f"Filling warehouse history gaps of {len(gap_histories)} "
+                    "entities from the external sources"
+                )
+                fallback_data = self.fallback_transformer.transform()
+                complete_entities = read_entities - set(gap_histories)
+                fallback_data = fallback_data.loc[
+                    ~fallback_data["entity"].isin(complete_entities)
+                ]
+                yield from self.merge_histories(gap_histories, fallback_data)
+            return
+
+        entities_by_gap_start = {}
+        for entity in expected_entities:
+            if entity in gap_starts or entity not in read_entities:
+                gap_start = gap_starts.get(entity, start_date)
+                entities_by_gap_start.setdefault(gap_start, []).append(entity)
+
+        for gap_start, entities in entities_by_gap_start.items():
+            logging.info(
+                f"Downloading the history of {len(entities)} entities with "
+                f"warehouse gaps since {gap_start} from the external sources"
+            )
+            fallback_data = self.fallback_transformer.transform_entities(
+                entities, since=gap_start
+            )
+            yield from self.merge_histories(
+                {entity: gap_histories.pop(entity, None) for entity in entities},
+                fallback_data,
+            )
+
+    def merge_histories(
+        self, warehouse_histories: dict, fallback_data: pd.DataFrame
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Yields the history of every entity of either, the warehouse rows are
+        kept for days that are in both.
+        """
+        fallback_histories = {}
+        if not fallback_data.empty:
+            fallback_histories = {
+                entity: history.loc[:, self.COLUMNS]
+                for entity, history in fallback_data.groupby(
+                    "entity", sort=False, observed=True
+                )
+            }
+
+        for entity in {**warehouse_histories, **fallback_histories}:
+            histories = [
+                history
+                for history in (
+                    warehouse_histories.get(entity),
+                    fallback_histories.get(entity),
+                )
+                if history is not None
+            ]
+            if histories:
+                yield pd.concat(histories, ignore_index=True).drop_duplicates(
+                    subset=["year", "month", "day"], keep="first"
+                )
+
+    def get_training_query(self, start_date):
+        coin_prices = (
+            select(
+                FtCoinPrice.uuid.label("entity"),
+                func.avg(FtCoinPrice.price).label("price"),
+                DimDate.date,
+                DimDate.year,
+                DimDate.month,
+                DimDate.day,
+            )
+            .join(DimDate, FtCoinPrice.date_id == DimDate.date_id)
+            .where(DimDate.date >= start_date)
+            .group_by(
+                FtCoinPrice.uuid, DimDate.date, DimDate.year, DimDate.month, DimDate.day
+            )
+        )
+        stock_prices = (
+            select(
+                FtStockPrice.symbol.label("entity"),
+                func.avg(FtStockPrice.close).label("price"),
+                DimDate.date,
+                DimDate.year,
+                DimDate.month,
+                DimDate.day,
+            )
+            .join(DimDate, FtStockPrice.date_id == DimDate.date_id)
+            .where(DimDate.date >= start_date)
+            .group_by(
+                FtStockPrice.symbol,
+                DimDate.date,
+                DimDate.year,
+                DimDate.month,
+                DimDate.day,
+            )
+        )
+        # Ordered by entity, so the chunks of the result can be cut into
+        # entity histories while they are read.
+        return union_all(coin_prices, stock_prices).order_by("entity", "date")
+
+    def iter_warehouse_histories(self, start_date) -> Iterator[pd.DataFrame]:
+        """
+        Reads the query in chunks of chunksize rows and yields the history of
+        one entity at a time, so only one chunk is held in memory.
+        """
+        remainder = None
+        with self.engine.connect() as connection:
+            connection = connection.execution_options(stream_results=True)
+            for chunk in pd.read_sql(
+                self.get_training_query(start_date),
+                connection,
+                chunksize=self.chunksize,
+            ):
+                chunk["datetime"] = pd.to_datetime(chunk["date"])
+                chunk = chunk.loc[:, self.COLUMNS]
+                if remainder is not None:
+                    chunk = pd.concat([remainder, chunk], ignore_index=True)
+                # The last entity of the chunk may continue in the next one.
+                is_last_entity = chunk["entity"] == chunk["entity"].iloc[-1]
+                remainder = chunk[is_last_entity]
+                for _, history in chunk[~is_last_entity].groupby("entity", sort=False):
+                    yield history.reset_index(drop=True)
+
+        if remainder is not None:
+            yield remainder.reset_index(drop=True)
+
+    def get_gap_start(self, history: pd.DataFrame, start_date) -> Optional[date]:
+        """
+        Returns the date from which the history of an entity has to be
+        downloaded again, or None when it has no gap of more than
+        max_gap_days: at its start, between two days or up to today.
+        """
+        max_gap = pd.Timedelta(days=self.max_gap_days)
+        dates = history["datetime"].sort_values(ignore_index=True)
+        if dates.iloc[0] - pd.Timestamp(start_date) > max_gap:
+            return start_date
+
+        gaps = dates.diff()
+        if (gaps > max_gap).any():
+            return dates.iloc[gaps.gt(max_gap).idxmax() - 1].date()
+
+        if pd.Timestamp(datetime.now().date()) - dates.iloc[-1] > max_gap:
+            return dates.iloc[-1].date()
+        return None
+
 
 class PredictionsData(Transformer):
     def __init__(
-        self, training_data_transformer: ModelTrainingData, model: Model
+        self,
+        training_data_transformer: ModelTrainingData,
+        model: "Model",
+        max_workers: int = 1,
+        global_model: bool = False,
     ) -> None:
         super().__init__()
         self.trainig_data_transformer = training_data_transformer
         self.model = model
+        self.max_workers = max_workers
+        self.global_model = global_model
 
     def transform(self) -> pd.DataFrame:
-        self.results = []
-
         training_df = self.trainig_data_transformer.transform()
+        self.processed_data = self.predict(training_df)
+        return self.processed_data
 
-        for entity in training_df["entity"].unique():
-            train_dataset = training_df.loc[
-                training_df["entity"] == entity, training_df.columns != "entity"
-            ]
-            predictions, result = self.model.lightgbm(train_dataset)
+    def iter_batches(self, batch_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        if self.global_model or not batch_size:
+            yield from super().iter_batches(batch_size)
+            return
+
+        # The iter_batches of the training transformers never split the rows
+        # of an entity across batches, so every batch is predicted on its own
+        # and only one batch of training data is held in memory.
+        for training_df in self.trainig_data_transformer.iter_batches(batch_size):
+            yield self.predict(training_df)
+
+    def get_entities(self) -> Optional[list]:
+        if self.global_model:
+            return None
+
+        self.training_df = self.trainig_data_transformer.transform()
+        return list(self.training_df["entity"].unique())
+
+    def transform_entities(self, entities: list) -> pd.DataFrame:
+        return self.predict(self.training_df[self.training_df["entity"].isin(entities)])
+
+    def predict(self, training_df: pd.DataFrame) -> pd.DataFrame:
+        self.results = []
+
+        if self.global_model:
+            trained = self.model.global_lightgbm(training_df)
+        elif self.max_workers != 1:
+            from src.ml.parallel import get_worker_count, train_entities_in_parallel
+
+            max_workers = get_worker_count(self.max_workers)
+            trained = (
+                train_entities_in_parallel(self.model, training_df, max_workers)
+                if max_workers > 1
+                else self.train_entities(training_df)
+            )
+        else:
+            trained = self.train_entities(training_df)
+
+        for entity, predictions, result in trained:
             self.clean_predictions(entity, predictions, result)
             self.results.append(result)
 
-        self.processed_data = pd.concat(self.results)
-        return self.processed_data
+        return pd.concat(self.results)
+
+    def train_entities(self, training_df: pd.DataFrame) -> Iterator[tuple]:
+        for entity, train_dataset in training_df.groupby(
+            "entity", sort=False, observed=True
+        ):
+            yield (
+                entity,
+                *self.model.lightgbm(train_dataset.drop(columns="entity"), entity),
+            )
 
     def clean_predictions(self, entity, predictions, result):
         result["predicted_values"] = predictions
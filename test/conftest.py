@@ -0,0 +1,16 @@
+from datetime import datetime
+
+import pytest
+
+from src.data_targets.engines import dispose_engines
+
+
+@pytest.fixture
+def connection_string(tmp_path) -> str:
+    yield f"sqlite:///{tmp_path / 'warehouse.db'}"
+    dispose_engines()
+
+
+@pytest.fixture
+def today() -> datetime:
+    return datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
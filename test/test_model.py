@@ -0,0 +1,66 @@
+import lightgbm as lgb
+import pandas as pd
+
+from src.ml.model import Model
+from src.ml.model_store import ModelStore
+
+
+def price_history(prices: list, end: str = "2024-06-14") -> pd.DataFrame:
+    dates = pd.date_range(end=end, periods=len(prices), freq="D")
+    return pd.DataFrame(
+        {
+            "price": prices,
+            "year": dates.year,
+            "month": dates.month,
+            "day": dates.day,
+        }
+    )
+
+
+def test_incremental_training_learns_a_week_of_new_rows(tmp_path):
+    model_store = ModelStore(str(tmp_path), full_retrain_every_n_runs=10)
+    model = Model(14, model_store=model_store, num_boost_round=100)
+    history = price_history([100.0 + day % 7 for day in range(300)])
+    model.lightgbm(history, "entity")
+    booster, metadata = model_store.load("entity")
+
+    new_history = price_history(list(history["price"]) + [400.0] * 5, "2024-06-19")
+    predictions, future_dates = model.lightgbm(new_history, "entity")
+    continued_booster, continued_metadata = model_store.load("entity")
+
+    assert continued_booster.num_trees() > booster.num_trees()
+    assert continued_metadata["runs_since_full_retrain"] == 1
+    assert continued_metadata["last_trained_date"] == "2024-06-19T00:00:00"
+    assert predictions.mean() > booster.predict(future_dates).mean() + 10
+
+
+def test_early_stopping_refits_the_whole_history_for_the_best_rounds(monkeypatch):
+    trainings = []
+    lgb_train = lgb.train
+
+    def train(params, train_set, num_boost_round, **kwargs):
+        booster = lgb_train(params, train_set, num_boost_round, **kwargs)
+        trainings.append((train_set.construct().num_data(), num_boost_round, booster))
+        return booster
+
+    monkeypatch.setattr("src.ml.model.lgb.train", train)
+    model = Model(14, early_stopping_rounds=5, num_boost_round=1000)
+    history = price_history([100.0 + day % 7 + day / 10 for day in range(300)])
+
+    model.train(history.drop(columns="price"), history["price"])
+
+    (_, _, early_stopped_booster), refit = trainings
+    assert 0 < early_stopped_booster.best_iteration < 1000
+    assert refit[:2] == (len(history), early_stopped_booster.best_iteration)
+
+
+def test_model_store_skips_saves_to_read_only_paths(tmp_path):
+    read_only_path = tmp_path / "read_only"
+    read_only_path.write_text("")
+    model_store = ModelStore(str(read_only_path))
+    model = Model(14, model_store=model_store, num_boost_round=10)
+
+    predictions, _ = model.lightgbm(price_history([100.0] * 50), "entity")
+
+    assert len(predictions) == 14
+    assert model_store.load("entity") == (None, None)
@@ -0,0 +1,97 @@
+import pandas as pd
+import pytest
+
+from benchmarks.run_benchmarks import QUERY_BUDGETS
+from benchmarks.synthetic import (
+    FrameTransformer,
+    SyntheticCoinList,
+    SyntheticStockInfo,
+    SyntheticStockPrice,
+    SyntheticTopStocksScraper,
+)
+from src.data_targets.engines import dispose_engines, query_budget
+from src.data_targets.targets import DBCoinTarget, DBPredictionTarget, DBStockTarget
+from src.transformations.transformations import (
+    CoinrankingToDailyStockData,
+    DailyStockData,
+)
+
+ENTITIES = 3
+
+
+def coin_transformer(entities: int):
+    return CoinrankingToDailyStockData(SyntheticCoinList(entities), entities)
+
+
+def stock_transformer(entities: int):
+    return DailyStockData(
+        SyntheticTopStocksScraper(entities),
+        SyntheticStockInfo(),
+        SyntheticStockPrice(),
+        entities,
+    )
+
+
+def prediction_transformer(entities: int):
+    return FrameTransformer(
+        pd.DataFrame(
+            [
+                {"entity": f"entity-{index}", "datetime": day, "predicted_values": 1.0}
+                for index in range(entities)
+                for day in pd.date_range("2024-06-15", periods=14, freq="D")
+            ]
+        )
+    )
+
+
+def save_within_budget(tmp_path, stage, target_class, make_transformer, **options):
+    budget = QUERY_BUDGETS[stage]
+    statements = []
+    try:
+        for entities in (ENTITIES, 4 * ENTITIES):
+            target = target_class(
+                f"sqlite:///{tmp_path / f'{entities}.db'}", max_retries=1, **options
+            )
+            with query_budget(budget, f"{stage} of {entities} entities"):
+                target.save(make_transformer(entities))
+            statements.append(target.last_save_statements)
+    finally:
+        dispose_engines()
+    return statements
+
+
+@pytest.mark.parametrize("smart_dimension_keys", [False, True])
+@pytest.mark.parametrize(
+    "name, target_class, make_transformer",
+    [
+        ("coin", DBCoinTarget, coin_transformer),
+        ("stock", DBStockTarget, stock_transformer),
+    ],
+)
+def test_daily_bulk_save_is_within_query_budget(
+    tmp_path, name, target_class, make_transformer, smart_dimension_keys
+):
+    stage = f"{name}_daily_save_bulk" + ("_smart_keys" if smart_dimension_keys else "")
+    statements = save_within_budget(
+        tmp_path,
+        stage,
+        target_class,
+        make_transformer,
+        bulk_load=True,
+        smart_dimension_keys=smart_dimension_keys,
+    )
+
+    assert statements[0] == statements[1]
+
+
+@pytest.mark.parametrize("replace_mode", ["atomic", "changed"])
+def test_prediction_save_is_within_query_budget(tmp_path, replace_mode):
+    statements = save_within_budget(
+        tmp_path,
+        f"prediction_save_{replace_mode}",
+        DBPredictionTarget,
+        prediction_transformer,
+        replace_mode=replace_mode,
+    )
+
+    assert statements[0] == statements[1]
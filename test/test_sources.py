@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from src.data_sources.cache import PriceHistoryCache
+from src.data_sources.sources import APISource, CoinrankingCoinPriceHistory
+
+
+def history(datetimes: list, price: float) -> list:
+    return [
+        {"timestamp": int(value.timestamp()), "price": f"{price:.2f}"}
+        for value in sorted(datetimes, reverse=True)
+    ]
+
+
+def test_coin_price_top_up_keeps_one_price_per_day(tmp_path, monkeypatch):
+    watermark = (datetime.now() - timedelta(days=3)).replace(hour=12, minute=0)
+    cached_days = [watermark - timedelta(days=days_ago) for days_ago in range(5)]
+    new_days = [watermark + timedelta(hours=6)] + [
+        watermark + timedelta(days=days_ahead) for days_ahead in (1, 2)
+    ]
+    responses = [history(cached_days, 100), history(cached_days + new_days, 200)]
+    monkeypatch.setattr(
+        APISource,
+        "get_data",
+        lambda self, url, params=None: {"data": {"history": responses.pop(0)}},
+    )
+    source = CoinrankingCoinPriceHistory(
+        "https://coins.invalid/coin/<uuid>/history",
+        params={"timePeriod": "5y"},
+        cache=PriceHistoryCache(str(tmp_path)),
+    )
+
+    source.get_data("coin")
+    data = pd.DataFrame(source.get_data("coin")["data"]["history"])
+
+    days = pd.to_datetime(data["timestamp"], unit="s").dt.date
+    assert not days.duplicated().any()
+    assert len(data) == 5 + 2
+    watermark_day = data[data["timestamp"] == int(new_days[0].timestamp())]
+    assert list(watermark_day["price"]) == ["200.00"]
+
+
+def test_price_history_cache_skips_writes_to_read_only_paths(tmp_path):
+    read_only_path = tmp_path / "read_only"
+    read_only_path.write_text("")
+    cache = PriceHistoryCache(str(read_only_path))
+
+    cache.write("namespace", "entity", pd.DataFrame({"price": [1.0]}), datetime.now())
+
+    assert cache.read("namespace", "entity") == (None, None)
+
+
+def test_coin_price_history_since_requests_the_shortest_time_period(monkeypatch):
+    requests = []
+    monkeypatch.setattr(
+        APISource,
+        "get_data",
+        lambda self, url, params=None: requests.append(params) or {},
+    )
+    source = CoinrankingCoinPriceHistory(
+        "https://coins.invalid/coin/<uuid>/history", params={"timePeriod": "5y"}
+    )
+
+    source.get_data("coin", (datetime.now() - timedelta(days=20)).date())
+    source.get_data("coin")
+
+    assert requests == [{"timePeriod": "30d"}, None]
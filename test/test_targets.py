@@ -0,0 +1,170 @@
+import pandas as pd
+import pytest
+from sqlalchemy import select, text
+
+from benchmarks.synthetic import FrameTransformer, coin_rows
+from src.data_targets.db_orm import (
+    DimDate,
+    DimTime,
+    FtCoinPrice,
+    PipelineRun,
+    Predictions,
+)
+from src.data_targets.targets import DBCoinTarget, DBPredictionTarget
+
+FACT_ROWS_QUERY = text(
+    "SELECT f.uuid, d.date, t.time, f.price FROM ft_coin_price_t f "
+    "JOIN dim_date_t d ON d.date_id = f.date_id "
+    "JOIN dim_time_t t ON t.time_id = f.time_id "
+    "ORDER BY f.uuid, d.date, t.time"
+)
+
+
+def read_fact_rows(target) -> list:
+    with target.engine.connect() as connection:
+        return [
+            (uuid, str(date), str(time)[:8], price)
+            for uuid, date, time, price in connection.execute(FACT_ROWS_QUERY)
+        ]
+
+
+@pytest.mark.parametrize("bulk_load", [False, True])
+def test_smart_key_migration_keeps_fact_rows(connection_string, bulk_load):
+    # Surrogate time keys 1, 2 and 3 are also the smart keys of 00:00:01 to
+    # 00:00:03, so the migration has to move keys that are still referenced.
+    # 2020-12-31 is in ISO week 53 and outside of the calendar range.
+    legacy_target = DBCoinTarget(connection_string, max_retries=1, bulk_load=bulk_load)
+    for value in ["2024-06-14 00:00:03", "2024-06-14 00:00:01", "2020-12-31 10:11:12"]:
+        legacy_target.save(FrameTransformer(coin_rows([value]), "uuid"))
+    fact_rows = read_fact_rows(legacy_target)
+
+    target = DBCoinTarget(
+        connection_string,
+        max_retries=1,
+        bulk_load=bulk_load,
+        smart_dimension_keys=True,
+        calendar_start_date="2024-01-01",
+        calendar_end_date="2024-12-31",
+    )
+
+    assert read_fact_rows(target) == fact_rows
+    with target.Session() as session:
+        dates = session.execute(select(DimDate.date_id, DimDate.date)).all()
+        times = session.execute(select(DimTime.time_id, DimTime.time)).all()
+        fact_keys = session.execute(
+            select(FtCoinPrice.date_id, FtCoinPrice.time_id).distinct()
+        ).all()
+    assert all(date_id == int(date.strftime("%Y%m%d")) for date_id, date in dates)
+    assert len(dates) == 366 + 1
+    assert all(
+        time_id == time.hour * 3600 + time.minute * 60 + time.second
+        for time_id, time in times
+    )
+    assert len(times) == 86_400
+    assert set(fact_keys) == {(20240614, 3), (20240614, 1), (20201231, 36672)}
+
+    target.save(FrameTransformer(coin_rows(["2024-06-15 16:00:05"]), "uuid"))
+    assert len(read_fact_rows(target)) == len(fact_rows) + 3
+
+    # Keys generated with smart keys turned off again continue after them.
+    legacy_target.save(FrameTransformer(coin_rows(["2050-01-01 12:00:00.5"]), "uuid"))
+    assert len(read_fact_rows(legacy_target)) == len(fact_rows) + 6
+
+
+def predictions(entities: list) -> pd.DataFrame:
+    return pd.DataFrame(
+        [
+            {
+                "entity": entity,
+                "datetime": day,
+                "predicted_values": float(index),
+            }
+            for index, entity in enumerate(entities)
+            for day in pd.date_range("2024-06-15", periods=3, freq="D")
+        ]
+    )
+
+
+def test_chunked_save_resumes_after_failure(connection_string):
+    with DBPredictionTarget(connection_string, max_retries=1).Session() as session:
+        session.add(
+            Predictions(
+                entity="stale", datetime=pd.Timestamp("2024-06-15"), predicted_values=0
+            )
+        )
+        session.commit()
+
+    entities = [f"entity-{index}" for index in range(5)]
+    target = DBPredictionTarget(
+        connection_string, max_retries=1, replace_mode="atomic", chunk_size=2
+    )
+    transformer = FrameTransformer(predictions(entities))
+    transformer.fail_on = {"entity-2"}
+    with pytest.raises(Exception):
+        target.save(transformer)
+
+    assert transformer.transformed_entities == entities[:2]
+    with target.Session() as session:
+        saved_entities = set(session.scalars(select(Predictions.entity)))
+        runs = session.execute(select(PipelineRun.finished_at)).all()
+    assert saved_entities == {"stale", *entities[:2]}
+    assert runs == [(None,)]
+
+    transformer = FrameTransformer(predictions(entities))
+    target.save(transformer)
+
+    assert transformer.transformed_entities == entities[2:]
+    with target.Session() as session:
+        saved = session.execute(
+            select(Predictions.entity, Predictions.predicted_values)
+        ).all()
+        runs = session.execute(select(PipelineRun.finished_at)).all()
+    assert sorted(saved) == sorted(
+        (entity, float(index))
+        for index, entity in enumerate(entities)
+        for _ in range(3)
+    )
+    assert len(runs) == 1 and runs[0][0] is not None
+
+
+def test_key_cache_forgets_keys_of_rolled_back_saves(connection_string):
+    target = DBCoinTarget(connection_string, max_retries=1, key_cache_size=1_000)
+    failing_rows = coin_rows(["2024-06-14 10:00:00"])
+    failing_rows.loc[2, "price"] = None
+    with pytest.raises(Exception):
+        target.save(FrameTransformer(failing_rows, "uuid"))
+
+    target.save(
+        FrameTransformer(
+            coin_rows(["2024-06-15 11:00:00", "2024-06-14 10:00:00"]), "uuid"
+        )
+    )
+
+    assert [row[1:3] for row in read_fact_rows(target)[:2]] == [
+        ("2024-06-14", "10:00:00"),
+        ("2024-06-15", "11:00:00"),
+    ]
+    assert len(read_fact_rows(target)) == 6
+
+
+@pytest.mark.parametrize("batch_size", [0, 100])
+@pytest.mark.parametrize("replace_mode", DBPredictionTarget.REPLACE_MODES)
+def test_prediction_save_without_rows_keeps_the_old_predictions(
+    connection_string, replace_mode, batch_size
+):
+    entities = [f"entity-{index}" for index in range(2)]
+    DBPredictionTarget(connection_string, max_retries=1, replace_mode="atomic").save(
+        FrameTransformer(predictions(entities))
+    )
+    target = DBPredictionTarget(
+        connection_string,
+        max_retries=1,
+        replace_mode=replace_mode,
+        batch_size=batch_size,
+    )
+
+    target.save(FrameTransformer(predictions([])))
+
+    with target.Session() as session:
+        saved_entities = set(session.scalars(select(Predictions.entity)))
+    assert saved_entities == set(entities)
@@ -0,0 +1,93 @@
+from datetime import timedelta
+
+from dateutil.relativedelta import relativedelta
+import pandas as pd
+
+from benchmarks.synthetic import FrameTransformer, coin_rows, coin_uuid
+from src.data_targets.targets import DBCoinTarget
+from src.ml.model import Model
+from src.transformations.transformations import PredictionsData, WarehouseTrainingData
+
+
+def test_warehouse_predictions_are_batched_by_entity(connection_string, today):
+    num_of_coins = 4
+    days = [today - timedelta(days=days_ago) for days_ago in range(40)]
+    target = DBCoinTarget(
+        connection_string, max_retries=1, bulk_load=True, smart_dimension_keys=True
+    )
+    target.save(FrameTransformer(coin_rows(days, num_of_coins), "uuid"))
+    # Chunks of 7 rows make the entity histories continue across chunks.
+    training_data = WarehouseTrainingData(
+        target.engine, past_num_of_years=1, chunksize=7
+    )
+
+    batches = list(training_data.iter_batches(50))
+
+    assert len(batches) > 1
+    batch_entities = [set(batch["entity"]) for batch in batches]
+    assert sum(len(entities) for entities in batch_entities) == num_of_coins
+    assert all(
+        len(batch) == len(batch_entities[i]) * 40 for i, batch in enumerate(batches)
+    )
+
+    predictions = pd.concat(
+        PredictionsData(training_data, Model(14, num_boost_round=5)).iter_batches(50)
+    )
+
+    assert not predictions.duplicated(subset=["entity", "datetime"]).any()
+    assert predictions.groupby("entity").size().to_dict() == {
+        coin_uuid(index): 14 for index in range(num_of_coins)
+    }
+
+
+def test_warehouse_downloads_only_the_gaps(connection_string, today):
+    start_date = today.date() - relativedelta(years=1)
+    days = pd.date_range(start_date, today.date(), freq="D").to_pydatetime()
+    warehouse_rows = coin_rows([day.replace(hour=12) for day in days], 5)
+    day_index = {day.date(): index for index, day in enumerate(days)}
+    row_days = pd.to_datetime(warehouse_rows[["year", "month", "day"]]).dt.date
+    stale = (warehouse_rows["uuid"] == coin_uuid(1)) & (row_days > days[-21].date())
+    gap = (warehouse_rows["uuid"] == coin_uuid(2)) & row_days.map(
+        lambda day: len(days) - 26 <= day_index[day] < len(days) - 15
+    )
+    missing = warehouse_rows["uuid"] == coin_uuid(3)
+    target = DBCoinTarget(
+        connection_string, max_retries=1, bulk_load=True, smart_dimension_keys=True
+    )
+    target.save(FrameTransformer(warehouse_rows[~(stale | gap | missing)], "uuid"))
+    fallback = FrameTransformer(
+        pd.DataFrame(
+            [
+                {
+                    "datetime": pd.Timestamp(day.date()),
+                    "price": 999.0,
+                    "entity": coin_uuid(index),
+                    "year": day.year,
+                    "month": day.month,
+                    "day": day.day,
+                }
+                for index in range(4)
+                for day in days
+            ]
+        )
+    )
+
+    data = WarehouseTrainingData(
+        target.engine, fallback, past_num_of_years=1, chunksize=100
+    ).transform()
+
+    assert fallback.transformed_since == {
+        coin_uuid(1): days[-21].date(),
+        coin_uuid(2): days[-27].date(),
+        coin_uuid(3): start_date,
+    }
+    assert data.groupby("entity").size().to_dict() == {
+        coin_uuid(index): len(days) for index in range(4)
+    }
+    assert not data.duplicated(subset=["entity", "year", "month", "day"]).any()
+    downloaded = data[data["price"] == 999.0]
+    assert downloaded.groupby("entity").size().to_dict() == {
+        coin_uuid(1): 20,
+        coin_uuid(2): 11,
+        coin_uuid(3): len(days),
+    }